@@ -0,0 +1,203 @@
+"artifacts - on-disk cache of parsed indexes, trees and layouts"
+
+# Everything here is derived from an index file, so it is keyed by the
+# index's trailing checksum (plus layout parameters for layouts) and never
+# needs invalidating: a changed index simply has a different key.
+
+import array
+import hashlib
+import json
+import os
+import struct
+import sys
+import tempfile
+
+import gin
+from core import CompactNode, CompactTree
+
+MAGIC = b"GIVA"
+FORMAT = 1
+HEADER = struct.Struct("< 4s I I")
+
+def write_sections(filename, meta, sections):
+    """Write meta (JSON) and named arrays/bytes to filename, atomically
+
+    Arrays are stored raw in native byte order, so loading one is a single
+    bulk copy rather than any per-element decoding.
+    """
+    layout = [[name, data.typecode if isinstance(data, array.array) else "B", memoryview(data).nbytes]
+        for name, data in sections]
+    header = json.dumps({"byteorder": sys.byteorder, "meta": meta, "sections": layout}).encode("utf-8")
+
+    directory = os.path.dirname(filename)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as o:
+            o.write(HEADER.pack(MAGIC, FORMAT, len(header)))
+            o.write(header)
+            for _, data in sections:
+                o.write(data)
+        os.replace(tmp, filename)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+def read_sections(filename):
+    "meta and {name: array or bytes} from a file written by write_sections, or None"
+    try:
+        o = open(filename, "rb")
+    except FileNotFoundError:
+        return None
+    with o:
+        if os.fstat(o.fileno()).st_size < HEADER.size:
+            return None
+        f = gin.open_index(o)
+        magic, fmt, header_size = HEADER.unpack_from(f)
+        if magic != MAGIC or fmt != FORMAT:
+            f.close()
+            return None
+        header = json.loads(f[HEADER.size:HEADER.size + header_size].decode("utf-8"))
+
+        pos = HEADER.size + header_size
+        sections = {}
+        with memoryview(f) as view:
+            for name, typecode, size in header["sections"]:
+                if typecode == "B":
+                    sections[name] = bytes(view[pos:pos + size])
+                else:
+                    sections[name] = array.array(typecode)
+                    sections[name].frombytes(view[pos:pos + size])
+                    if header["byteorder"] != sys.byteorder:
+                        sections[name].byteswap()
+                pos += size
+        f.close()
+    return header["meta"], sections
+
+def flatten_tree(tree):
+    "Names, parent positions and sizes of tree's nodes in pre-order"
+    if isinstance(tree, CompactNode) and tree.index == 0:
+        # Already stored this way
+        return tree.tree.names, tree.tree.parents, tree.tree.sizes
+    names = []
+    parents = array.array("i")
+    sizes = array.array("Q")
+    pending = [(tree, -1)]
+    while pending:
+        node, parent = pending.pop()
+        parents.append(parent)
+        names.append(node.name)
+        sizes.append(node.size)
+        position = len(names) - 1
+        pending.extend((child, position) for child in reversed(list(node.children.values())))
+    return names, parents, sizes
+
+class ArtifactCache:
+    "Parsed entries, trees and node positions stored under directory"
+
+    def __init__(self, directory, size_limit=512 * 1024 * 1024):
+        self.directory = directory
+        self.size_limit = size_limit  # Bytes
+
+    def path(self, checksum, kind, params=None):
+        name = checksum
+        if params:
+            encoded = json.dumps(params, sort_keys=True).encode("utf-8")
+            name += "-" + hashlib.md5(encoded).hexdigest()[:16]
+        return os.path.join(self.directory, "%s.%s" % (name, kind))
+
+    def load(self, checksum, kind, params=None):
+        if checksum == gin.NULL_SHA1:
+            return None
+        filename = self.path(checksum, kind, params)
+        loaded = read_sections(filename)
+        if loaded is not None:
+            # Mark as recently used for evict()
+            os.utime(filename, None)
+        return loaded
+
+    def store(self, checksum, kind, meta, sections, params=None):
+        if checksum == gin.NULL_SHA1:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        write_sections(self.path(checksum, kind, params), meta, sections)
+
+    def load_columns(self, checksum):
+        "The gin.IndexColumns stored for checksum, or None"
+        loaded = self.load(checksum, "columns")
+        if loaded is None:
+            return None
+        meta, sections = loaded
+        columns = gin.IndexColumns(meta["version"])
+        for field in gin.ENTRY_STAT_FIELDS + ("flags", "extra_flags", "name_offsets"):
+            setattr(columns, field, sections[field])
+        columns.sha1 = bytearray(sections["sha1"])
+        columns.name_data = bytearray(sections["name_data"])
+        if columns.prefix_lengths is not None:
+            columns.prefix_lengths = sections["prefix_lengths"]
+        columns.extensions = [(signature, sections["extension%d" % n])
+            for n, signature in enumerate(meta["extensions"])]
+        columns.checksum = checksum
+        return columns
+
+    def store_columns(self, columns):
+        sections = [(field, getattr(columns, field))
+            for field in gin.ENTRY_STAT_FIELDS + ("sha1", "flags", "extra_flags", "name_offsets", "name_data")]
+        if columns.prefix_lengths is not None:
+            sections.append(("prefix_lengths", columns.prefix_lengths))
+        sections.extend(("extension%d" % n, data) for n, (_, data) in enumerate(columns.extensions))
+        meta = {"version": columns.version, "extensions": [signature for signature, _ in columns.extensions]}
+        self.store(columns.checksum, "columns", meta, sections)
+
+    def load_tree(self, checksum):
+        "The root core.CompactNode of the tree stored for checksum, or None"
+        loaded = self.load(checksum, "tree")
+        if loaded is None:
+            return None
+        _, sections = loaded
+        names = sections["names"].decode("utf-8").split("\x00")
+        return CompactTree.from_preorder(names, sections["parents"], sections["sizes"]).root()
+
+    def store_tree(self, checksum, tree):
+        names, parents, sizes = flatten_tree(tree)
+        # Paths never contain NUL, so it can separate the names
+        sections = [("names", "\x00".join(names).encode("utf-8")), ("parents", parents), ("sizes", sizes)]
+        self.store(checksum, "tree", {}, sections)
+
+    def load_layout(self, checksum, params):
+        "{node: coordinates} stored for checksum and layout params, or None"
+        loaded = self.load(checksum, "layout", params)
+        if loaded is None:
+            return None
+        meta, sections = loaded
+        nodes = sections["nodes"].decode("utf-8").split("\x00")
+        coordinates = sections["coordinates"]
+        dim = meta["dim"]
+        return {node: tuple(coordinates[n * dim:(n + 1) * dim]) for n, node in enumerate(nodes)}
+
+    def store_layout(self, checksum, params, pos):
+        nodes = list(pos)
+        dim = len(pos[nodes[0]]) if nodes else 0
+        coordinates = array.array("d")
+        for node in nodes:
+            coordinates.extend(float(value) for value in pos[node])
+        sections = [("nodes", "\x00".join(nodes).encode("utf-8")), ("coordinates", coordinates)]
+        self.store(checksum, "layout", {"dim": dim}, sections, params)
+
+    def size(self):
+        "Total bytes of stored artifacts"
+        if not os.path.isdir(self.directory):
+            return 0
+        return sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file())
+
+    def evict(self):
+        "Remove the least recently used artifacts until within size_limit"
+        if not os.path.isdir(self.directory):
+            return
+        files = [(entry.stat().st_mtime, entry.stat().st_size, entry.path)
+            for entry in os.scandir(self.directory) if entry.is_file()]
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.size_limit:
+                break
+            os.remove(path)
+            total -= size
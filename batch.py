@@ -0,0 +1,262 @@
+"batch - index statistics for many repositories at once"
+
+# Each repository's index is parsed with gin.parse_columns and reduced to a
+# small summary in a worker process, so that only summaries cross process
+# boundaries. Results are written as JSON Lines as they complete, followed
+# by one line totalling them all.
+
+import collections
+import concurrent.futures
+import itertools
+import json
+import os
+import struct
+import sys
+import time
+from operator import itemgetter
+
+import gin
+
+# Entries of each top list in a summary
+TOP = 10
+
+# Repositories each worker process handles before it is replaced, which
+# returns whatever memory the largest index left behind to the system;
+# from Python 3.11, which added max_tasks_per_child
+TASKS_PER_WORKER = 16
+
+def index_path(path):
+    "The index file of a repository, given it or its work tree, .git directory or index"
+    if os.path.isfile(path):
+        return path
+    for candidate in (os.path.join(path, ".git", "index"), os.path.join(path, "index")):
+        if os.path.isfile(candidate):
+            return candidate
+    raise FileNotFoundError("no index file in %s" % path)
+
+def extension(name):
+    "A path's file extension, lowercased, or \"\" for none"
+    basename = name.rpartition("/")[2]
+    stem, dot, suffix = basename.rpartition(".")
+    return "." + suffix.lower() if dot and stem else ""
+
+def top_items(counts, top, key):
+    return sorted(counts.items(), key=key, reverse=True)[:top]
+
+def summarize_columns(columns, top=TOP):
+    "Summary statistics of a gin.IndexColumns, as a dict ready for JSON"
+    names = columns.names()
+    sizes_by_entry = columns.size
+    total_size = sum(sizes_by_entry)
+    suffixes = list(map(extension, names))
+    files = collections.Counter(suffixes)
+    sizes = collections.Counter()
+    for suffix, size in zip(suffixes, sizes_by_entry):
+        sizes[suffix] += size
+    # Index order keeps the files of one directory mostly together
+    directory_files = collections.Counter()
+    directory_sizes = collections.Counter()
+    directories = (name.rpartition("/")[0] for name in names)
+    for directory, group in itertools.groupby(zip(directories, sizes_by_entry), key=itemgetter(0)):
+        group = [size for _, size in group]
+        directory_files[directory] += len(group)
+        directory_sizes[directory] += sum(group)
+    skip_worktree = []
+    intent_to_add = 0
+    if any(columns.extra_flags):
+        for n, extra_flags in enumerate(columns.extra_flags):
+            if extra_flags & gin.SKIP_WORKTREE:
+                skip_worktree.append(names[n])
+            if extra_flags & gin.INTENT_TO_ADD:
+                intent_to_add += 1
+    unmerged = sum(1 for flags in columns.flags if flags & gin.STAGE_MASK)
+
+    # Roll each directory's totals up into its parents, deepest first;
+    # parents holding no files themselves only appear on the way
+    levels = collections.defaultdict(list)
+    for directory in directory_files:
+        levels[directory.count("/") + 1 if directory else 0].append(directory)
+    for depth in range(max(levels, default=0), 0, -1):
+        for directory in levels[depth]:
+            parent = directory.rpartition("/")[0]
+            if parent not in directory_files:
+                levels[depth - 1].append(parent)
+            directory_files[parent] += directory_files[directory]
+            directory_sizes[parent] += directory_sizes[directory]
+    directory_files.pop("", None)
+    directory_sizes.pop("", None)
+
+    summary = collections.OrderedDict()
+    summary["version"] = columns.version
+    summary["entries"] = len(columns)
+    summary["size"] = total_size
+    summary["directories"] = len(directory_files)
+    summary["checksum"] = columns.checksum
+    summary["extensions"] = [
+        collections.OrderedDict([("extension", suffix), ("files", count), ("size", sizes[suffix])])
+        for suffix, count in top_items(files, top, lambda item: (item[1], sizes[item[0]]))]
+    summary["largest_directories"] = [
+        collections.OrderedDict([("path", directory), ("files", directory_files[directory]), ("size", size)])
+        for directory, size in top_items(directory_sizes, top, lambda item: item[1])]
+    summary["skip_worktree"] = len(skip_worktree)
+    summary["skip_worktree_paths"] = skip_worktree[:top]
+    summary["intent_to_add"] = intent_to_add
+    summary["unmerged"] = unmerged
+    # Uncapped, so that the totals over all repositories stay exact
+    summary["extension_files"] = dict(files)
+    summary["extension_sizes"] = dict(sizes)
+    return summary
+
+def summarize(repo, top=TOP):
+    "The summary of one repository, with timings, or its error; runs in worker processes"
+    result = collections.OrderedDict([("repo", repo)])
+    start = time.perf_counter()
+    try:
+        filename = index_path(repo)
+        result["index"] = filename
+        columns = gin.parse_columns(filename)
+        parsed = time.perf_counter()
+        result.update(summarize_columns(columns, top))
+        del columns
+    except (OSError, ValueError) as e:
+        result["error"] = "%s: %s" % (type(e).__name__, e)
+    except (struct.error, SystemExit):
+        # Truncated, or failing one of gin's checks, which exit
+        result["error"] = "invalid index"
+    if "error" in result:
+        result["seconds"] = {"total": round(time.perf_counter() - start, 6)}
+        return result
+    end = time.perf_counter()
+    result["seconds"] = collections.OrderedDict([
+        ("parse", round(parsed - start, 6)),
+        ("summarize", round(end - parsed, 6)),
+        ("total", round(end - start, 6))])
+    return result
+
+def read_manifest(filename):
+    "Repository paths listed one per line in filename (\"-\" for stdin); blank lines and # comments are skipped"
+    o = sys.stdin if filename == "-" else open(filename, encoding="utf-8")
+    try:
+        for line in o:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+    finally:
+        if o is not sys.stdin:
+            o.close()
+
+def summarize_all(repos, jobs=None, top=TOP):
+    """Summaries of repos, yielded as they complete
+
+    repos may be any iterable, such as a manifest being read; at most a
+    couple of repositories per worker are queued at any time, so memory
+    does not grow with their number.
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    repos = iter(repos)
+    if jobs <= 1:
+        for repo in repos:
+            yield summarize(repo, top)
+        return
+    options = {}
+    if sys.version_info >= (3, 11):
+        # Not available before Python 3.11, where workers are kept throughout
+        options["max_tasks_per_child"] = TASKS_PER_WORKER
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, **options) as executor:
+        pending = set()
+        for repo in repos:
+            pending.add(executor.submit(summarize, repo, top))
+            if len(pending) >= 2 * jobs:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in concurrent.futures.as_completed(pending):
+            yield future.result()
+
+class Totals:
+    "Running totals over repository summaries, kept small whatever their number"
+
+    def __init__(self, top=TOP):
+        self.top = top
+        self.repos = 0
+        self.failed = 0
+        self.entries = 0
+        self.size = 0
+        self.skip_worktree = 0
+        self.seconds = 0.0
+        self.files = collections.Counter()
+        self.sizes = collections.Counter()
+        self.largest = []
+
+    def add(self, summary):
+        self.repos += 1
+        self.seconds += summary["seconds"]["total"]
+        if "error" in summary:
+            self.failed += 1
+            return
+        self.entries += summary["entries"]
+        self.size += summary["size"]
+        self.skip_worktree += summary["skip_worktree"]
+        self.files.update(summary["extension_files"])
+        self.sizes.update(summary["extension_sizes"])
+        self.largest.append((summary["entries"], summary["repo"]))
+        self.largest = sorted(self.largest, reverse=True)[:self.top]
+
+    def summary(self, elapsed):
+        totals = collections.OrderedDict()
+        totals["repos"] = self.repos
+        totals["failed"] = self.failed
+        totals["entries"] = self.entries
+        totals["size"] = self.size
+        totals["skip_worktree"] = self.skip_worktree
+        totals["extensions"] = [
+            collections.OrderedDict([("extension", suffix), ("files", count), ("size", self.sizes[suffix])])
+            for suffix, count in top_items(self.files, self.top, lambda item: (item[1], self.sizes[item[0]]))]
+        totals["largest_repos"] = [
+            collections.OrderedDict([("repo", repo), ("entries", entries)]) for entries, repo in self.largest]
+        totals["seconds"] = collections.OrderedDict([
+            ("worker", round(self.seconds, 6)),
+            ("elapsed", round(elapsed, 6))])
+        return totals
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="summarize the Git indexes of many repositories as JSON Lines")
+    parser.add_argument("repos", nargs="*",
+        help="repository work trees, .git directories or index files")
+    parser.add_argument("-m", "--manifest", action="append", default=[],
+        help="file listing one repository per line, - for stdin; may be repeated")
+    parser.add_argument("-j", "--jobs", type=int,
+        help="worker processes (default: one per CPU)")
+    parser.add_argument("-t", "--top", type=int, default=TOP,
+        help="entries in each top list (default: %(default)s)")
+    parser.add_argument("--full", action="store_true",
+        help="keep every extension's counts in each repository's line")
+    args = parser.parse_args()
+
+    repos = list(args.repos)
+    if not repos and not args.manifest:
+        parser.print_usage()
+        sys.exit(2)
+
+    def all_repos():
+        yield from repos
+        for manifest in args.manifest:
+            yield from read_manifest(manifest)
+
+    start = time.perf_counter()
+    totals = Totals(args.top)
+    for summary in summarize_all(all_repos(), args.jobs, args.top):
+        totals.add(summary)
+        if not args.full:
+            summary.pop("extension_files", None)
+            summary.pop("extension_sizes", None)
+        print(json.dumps(summary), flush=True)
+    print(json.dumps({"totals": totals.summary(time.perf_counter() - start)}))
+    if totals.failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
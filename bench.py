@@ -0,0 +1,634 @@
+"bench - benchmarks for git-index-viz"
+
+import hashlib
+import os
+import struct
+import sys
+import tempfile
+import time
+
+import gin
+
+def synthetic_names(count, depth=3, fanout=10):
+    "count sorted paths spread over directories depth levels deep"
+    names = []
+    for n in range(count):
+        parts = []
+        rest = n
+        for level in range(depth):
+            rest, digit = divmod(rest, fanout)
+            parts.append("dir%d_%d" % (level, digit))
+        parts.append("file%d.txt" % n)
+        names.append("/".join(parts))
+    # Git sorts entries by the raw bytes of their paths
+    names.sort(key=lambda name: name.encode("utf-8"))
+    return names
+
+def encode_varint(value):
+    "The inverse of gin.decode_varint"
+    out = bytearray([value & 0x7F])
+    value >>= 7
+    while value:
+        value -= 1
+        out.insert(0, 0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(out)
+
+def cache_tree_data(names):
+    "TREE extension data for sorted paths, with made-up tree ids that follow the paths below"
+    out = bytearray()
+    # (component, first entry, end, path prefix) of directories to write;
+    # git writes them depth first
+    pending = [("", 0, len(names), "")]
+    while pending:
+        component, lo, hi, prefix = pending.pop()
+        subtrees = []
+        n = lo
+        while n < hi:
+            slash = names[n].find("/", len(prefix))
+            if slash < 0:
+                n += 1
+                continue
+            sub_prefix = names[n][:slash + 1]
+            end = n
+            while end < hi and names[end].startswith(sub_prefix):
+                end += 1
+            subtrees.append((names[n][len(prefix):slash], n, end, sub_prefix))
+            n = end
+        out += component.encode("utf-8") + b"\x00"
+        out += b"%d %d\n" % (hi - lo, len(subtrees))
+        out += hashlib.sha1("\x00".join(names[lo:hi]).encode("utf-8")).digest()
+        pending.extend(reversed(subtrees))
+    return bytes(out)
+
+def write_index(filename, names, version=2, blocks=0, tree=False, skip_worktree=0):
+    """Write a valid index file with made-up stat data for the given paths
+
+    With blocks > 0 the entries are split into that many IEOT blocks and
+    an EOIE extension is added, as git does with index.threads. With tree,
+    a TREE extension describing the directories is added. With
+    skip_worktree > 0 and version 3 or 4, every skip_worktree-th entry
+    has the extended skip-worktree flag, as in a sparse checkout.
+    """
+    out = bytearray(b"DIRC")
+    out += struct.pack("! I I", version, len(names))
+    block_size = -(-len(names) // blocks) if blocks else len(names) + 1
+    offsets = []
+    previous = b""
+    for n, name in enumerate(names):
+        block_start = n % block_size == 0
+        if block_start:
+            offsets.append((len(out), min(block_size, len(names) - n)))
+        encoded = name.encode("utf-8")
+        extended = version >= 3 and skip_worktree and n % skip_worktree == 0
+        out += gin.ENTRY_HEADER.pack(
+            1700000000 + n, n % 1000000000,
+            1700000000 + n, n % 1000000000,
+            2049, 100000 + n, 0o100644, 1000, 1000, (n * 37) % 65536,
+            hashlib.sha1(encoded).digest(),
+            min(len(encoded), 0xFFF) | (gin.EXTENDED if extended else 0))
+        if extended:
+            out += struct.pack("! H", gin.SKIP_WORKTREE)
+        if version == 4:
+            # Version 4 names are not compressed across block boundaries
+            shared = 0 if block_start else len(os.path.commonprefix([previous, encoded]))
+            out += encode_varint(len(previous) - shared)
+            out += encoded[shared:] + b"\x00"
+            previous = encoded
+            continue
+        out += encoded
+        entrylen = 62 + (2 if extended else 0) + len(encoded)
+        out += b"\x00" * ((8 - (entrylen % 8)) or 8)
+
+    extensions_start = len(out)
+    headers = hashlib.sha1()
+    extensions = []
+    if blocks:
+        extensions.append((b"IEOT", struct.pack("! I", 1) +
+            b"".join(struct.pack("! I I", *block) for block in offsets)))
+    if tree:
+        extensions.append((b"TREE", cache_tree_data(names)))
+    for signature, data in extensions:
+        header = signature + struct.pack("! I", len(data))
+        headers.update(header)
+        out += header + data
+    if blocks:
+        eoie = struct.pack("! I", extensions_start) + headers.digest()
+        out += b"EOIE" + struct.pack("! I", len(eoie)) + eoie
+
+    out += hashlib.sha1(out).digest()
+    with open(filename, "wb") as o:
+        o.write(out)
+
+# What report() printed, for --json
+RESULTS = []
+
+def best_of(repeat, function, *args):
+    "Shortest wall-clock time of repeat calls, in seconds"
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def report(label, seconds, baseline=None):
+    line = "  %-28s %8.3f s" % (label, seconds)
+    if baseline:
+        line += "  (%.1fx)" % (baseline / seconds)
+    print(line)
+    RESULTS.append({"label": label, "seconds": seconds})
+
+class TreeNode:
+    "A node of the dict-of-children tree CompactTree replaced, kept as the baseline to time it against"
+
+    def __init__(self, name, size=0):
+        self.name = name
+        self.size = size
+        self.children = {}
+
+def build_tree_from_index(columns, repo_url=None):
+    "columns as a tree of TreeNode, in one pass over the sorted paths as core.build_compact_tree makes"
+    import core
+
+    root = TreeNode(core.repo_name_from_url(repo_url))
+    # Directories along the previous path; entries are sorted, so consecutive
+    # paths share leading directories that need not be looked up again
+    stack = [root]
+    previous_parts = []
+    for name, file_size, shared in zip(columns.names(), columns.size, columns.shared_directories()):
+        parts = name.split('/')
+        if shared is None:
+            # No version 4 prefix to go by, so compare with the previous path
+            shared = 0
+            limit = min(len(parts), len(previous_parts)) - 1
+            while shared < limit and parts[shared] == previous_parts[shared]:
+                shared += 1
+        del stack[shared + 1:]
+        current_node = stack[-1]
+        for part in parts[shared:-1]:
+            if part not in current_node.children:
+                current_node.children[part] = TreeNode(part)
+            current_node = current_node.children[part]
+            stack.append(current_node)
+        if parts[-1] not in current_node.children:
+            current_node.children[parts[-1]] = TreeNode(parts[-1], file_size)
+        previous_parts = parts
+    return root
+
+def bench_tree(filename, repeat):
+    import core
+
+    def uncached(function, tree):
+        # CompactTree caches its totals, which would time a lookup
+        def run():
+            if isinstance(tree, core.CompactNode):
+                tree.tree._totals = None
+            return function(tree)
+        return run
+
+    columns = gin.parse_columns(filename)
+    report("build_tree_from_index", best_of(repeat, build_tree_from_index, columns))
+    cache_tree = columns.cache_tree()
+    label = "build_compact_tree%s" % (" with TREE" if cache_tree and cache_tree.entry_count == len(columns) else "")
+    report(label, best_of(repeat, core.build_compact_tree, columns))
+    for build in (build_tree_from_index, core.build_compact_tree):
+        tree = build(columns)
+        report("subtree_totals %s" % type(tree).__name__, best_of(repeat, uncached(core.subtree_totals, tree)))
+        report("build_graph %s" % type(tree).__name__, best_of(repeat, uncached(core.build_graph, tree)))
+
+def bench_search(filename, repeat):
+    import search
+
+    columns = gin.parse_columns(filename)
+    index = search.IndexSearch(columns)
+    print("search over %d paths:" % len(columns))
+    start = time.perf_counter()
+    index.build_trigrams()
+    report("build trigram index", time.perf_counter() - start)
+    middle = columns.name(len(columns) // 2)
+    directory = middle.rsplit("/", 1)[0] + "/"
+    basename = middle.rsplit("/", 1)[-1]
+    component = directory.rstrip("/").rsplit("/", 1)[-1]
+    pattern = "*%s?*" % basename[:-2]
+    suffix = "*" + basename[basename.rfind("."):]
+    queries = [
+        ("prefix " + directory, {"prefix": directory}),
+        ("substring " + basename, {"query": basename}),
+        ("substring " + component, {"query": component}),
+        ("substring " + basename[-2:], {"query": basename[-2:]}),
+        ("glob " + pattern, {"query": pattern}),
+        ("glob " + suffix, {"query": suffix}),
+        ("size 0:1000", {"size": (0, 1000)}),
+    ]
+    for label, kwargs in queries:
+        report(label[:28], best_of(repeat, lambda: index.search(**kwargs)))
+
+def bench_diff(count, repeat, version=2):
+    "diff_columns between two synthetic indexes a few paths apart, with and without TREE"
+    names = synthetic_names(count)
+    changed = names[::997] + ["new/file%d.txt" % n for n in range(10)]
+    kept = set(names[::997])
+    new_names = sorted((name for name in names if name not in kept), key=lambda name: name.encode("utf-8"))
+    new_names += ["new/file%d.txt" % n for n in range(10)]
+    print("diff of %d entries, %d paths changed:" % (count, len(changed)))
+    with tempfile.TemporaryDirectory() as tmp:
+        old, new = os.path.join(tmp, "old"), os.path.join(tmp, "new")
+        baseline = None
+        for tree in (False, True):
+            write_index(old, names, version, tree=tree)
+            write_index(new, new_names, version, tree=tree)
+            old_columns, new_columns = gin.parse_columns(old), gin.parse_columns(new)
+            elapsed = best_of(repeat, gin.diff_columns, old_columns, new_columns)
+            report("diff_columns%s" % (" with TREE" if tree else ""), elapsed, baseline)
+            baseline = elapsed
+
+def bench_status(count, repeat):
+    "status.worktree_status against git status on a fresh repository of count files"
+    import subprocess
+    import status
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Backdated, so that no entry is racily clean and both sides can
+        # go by stat data alone
+        past = time.time() - 3600
+        for name in synthetic_names(count):
+            path = os.path.join(tmp, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as o:
+                o.write(name)
+            os.utime(path, (past, past))
+        subprocess.run(["git", "init", "-q", tmp], check=True)
+        subprocess.run(["git", "-C", tmp, "add", "-A"], check=True)
+        subprocess.run(["git", "-C", tmp, "-c", "user.name=bench", "-c", "user.email=bench@localhost",
+            "commit", "-q", "-m", "bench"], check=True)
+        index_file = os.path.join(tmp, ".git", "index")
+        print("worktree status of %d files:" % count)
+
+        def git(*args):
+            subprocess.run(["git", "-C", tmp] + list(args), stdout=subprocess.DEVNULL, check=True)
+
+        baseline = best_of(repeat, git, "status", "--porcelain", "--untracked-files=no")
+        report("git status -uno", baseline)
+        report("git diff-files", best_of(repeat, git, "diff-files"), baseline)
+        columns = gin.parse_columns(index_file)
+        report("worktree_status", best_of(repeat, status.worktree_status, tmp, columns, index_file), baseline)
+        report("parse + worktree_status", best_of(repeat, status.worktree_status, tmp), baseline)
+        report("worktree_status jobs=1", best_of(repeat, status.worktree_status, tmp, columns, index_file, 1),
+            baseline)
+
+def bench_batch(count, repos, repeat, jobs):
+    "batch.summarize_all over repos synthetic indexes of count entries, serially and with jobs processes"
+    import resource
+    import batch
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for n in range(repos):
+            path = os.path.join(tmp, "index%d" % n)
+            write_index(path, synthetic_names(count), tree=True)
+            paths.append(path)
+        print("batch summaries of %d indexes of %d entries:" % (repos, count))
+        baseline = best_of(repeat, lambda: list(batch.summarize_all(paths, 1)))
+        report("summarize_all jobs=1", baseline)
+        for job_count in jobs or [os.cpu_count() or 1]:
+            elapsed = best_of(repeat, lambda: list(batch.summarize_all(paths, job_count)))
+            report("summarize_all jobs=%d" % job_count, elapsed, baseline)
+        # ru_maxrss is in kilobytes on Linux
+        print("  largest worker: %.1f MB" % (resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024))
+
+def bench_export(filename, repeat):
+    "The export backends against gin.parse_file's JSON"
+    import contextlib
+    import export
+
+    columns = gin.parse_columns(filename)
+    print("export of %d entries:" % len(columns))
+
+    def json_array():
+        with open(os.devnull, "w") as out, contextlib.redirect_stdout(out):
+            gin.parse_file(filename, pretty=False)
+
+    baseline = best_of(repeat, json_array)
+    report("parse_file pretty=False", baseline)
+    with tempfile.TemporaryDirectory() as tmp:
+        # A real file: zip archives need to know where they are in it
+        output = os.path.join(tmp, "export")
+        for format, fields in (("ndjson", None), ("csv", None), ("npz", None),
+                ("ndjson", ("size",)), ("npz", ("size", "name"))):
+            elapsed = best_of(repeat, export.export_file, filename, output, format, fields or export.FIELDS)
+            label = "parse + %s" % format + (" " + ",".join(fields) if fields else "")
+            report(label, elapsed, baseline)
+
+def bench_startup(repeat):
+    "Wall-clock time of fresh interpreters importing the modules and running the headless CLI"
+    import subprocess
+
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    def run(*args):
+        subprocess.run([sys.executable] + list(args), cwd=here, check=True,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    print("cold start:")
+    baseline = best_of(repeat, run, "-c", "pass")
+    report("python -c pass", baseline)
+    for module in ("gin", "core", "render", "matplotlib.pyplot"):
+        report("import %s" % module, best_of(repeat, run, "-c", "import " + module))
+    try:
+        run("-c", "import tkinter")
+    except subprocess.CalledProcessError:
+        print("  import gui                    skipped, no tkinter")
+    else:
+        report("import gui", best_of(repeat, run, "-c", "import gui"))
+    report("main.py --help", best_of(repeat, run, "main.py", "--help"))
+    with tempfile.TemporaryDirectory() as tmp:
+        index = os.path.join(tmp, "index")
+        write_index(index, synthetic_names(1000), tree=True)
+        for extension in (".png", ".svg"):
+            output = os.path.join(tmp, "tree" + extension)
+            report("main.py -o %s, 1000 entries" % extension[1:], best_of(repeat, run, "main.py", index, "-o", output))
+
+def bench_memory(filename):
+    "Bytes each tree builder leaves allocated, and its peak, per tracemalloc"
+    import tracemalloc
+    import core
+
+    columns = gin.parse_columns(filename)
+    print("tree memory for %d entries:" % len(columns))
+    for build in (build_tree_from_index, core.build_compact_tree):
+        tracemalloc.start()
+        tree = build(columns)
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del tree
+        print("  %-28s %8.1f MB retained, %8.1f MB peak" % (build.__name__, retained / 2**20, peak / 2**20))
+
+def bench_parse(filename, repeat):
+    def generator():
+        return list(gin.parse(filename, pretty=False))
+
+    def columns():
+        return gin.parse_columns(filename)
+
+    entries = len(gin.parse_columns(filename))
+    print("%s: %d entries, %d bytes" % (filename, entries, os.path.getsize(filename)))
+    baseline = best_of(repeat, generator)
+    report("gin.parse", baseline)
+    compact = best_of(repeat, columns)
+    report("gin.parse_columns", compact, baseline)
+    verified = best_of(repeat, gin.parse_columns, filename, 1, True)
+    report("parse_columns verify=True", verified, baseline)
+    report("gin.index_identity", best_of(repeat, gin.index_identity, filename), baseline)
+
+def bench_parallel(filename, repeat, jobs):
+    sequential = gin.parse_columns(filename)
+    baseline = best_of(repeat, gin.parse_columns, filename)
+    report("parse_columns jobs=1", baseline)
+    for count in jobs:
+        check_parallel = gin.parse_columns(filename, jobs=count)
+        assert check_parallel == sequential, "parallel parse differs from sequential"
+        elapsed = best_of(repeat, gin.parse_columns, filename, count)
+        report("parse_columns jobs=%d" % count, elapsed, baseline)
+
+def tree_graph(count, fanout=8):
+    "A networkx tree of count nodes, each with up to fanout children"
+    import networkx as nx
+
+    graph = nx.DiGraph()
+    graph.add_node("node0")
+    for n in range(1, count):
+        graph.add_edge("node%d" % ((n - 1) // fanout), "node%d" % n)
+    return graph
+
+def bench_layouts(repeat, sizes=(1000, 10000, 100000)):
+    import layout
+
+    for count in sizes:
+        graph = tree_graph(count)
+        print("layout of %d nodes:" % count)
+        # spring is O(n^2) per iteration, so it only runs on the smallest graph
+        baseline = best_of(repeat, layout.compute_layout, graph, "spring", 3) if count <= 1000 else None
+        if baseline:
+            report("spring", baseline)
+        for name in ("radial", "tree", "force"):
+            report(name, best_of(repeat, layout.compute_layout, graph, name, 3), baseline)
+
+def bench_render(repeat, sizes=(1000, 10000, 100000)):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import layout
+    import render
+
+    for count in sizes:
+        graph = tree_graph(count)
+        for node in graph:
+            graph.nodes[node]["size"] = 0
+        print("render of %d nodes:" % count)
+        for is_3d in (False, True):
+            pos = layout.compute_layout(graph, "radial", 3 if is_3d else 2)
+
+            def draw():
+                figure = plt.figure(figsize=(7, 5))
+                ax = figure.add_subplot(111, projection="3d" if is_3d else None)
+                render.draw_tree(graph, ax, is_3d, pos)
+                figure.canvas.draw()
+                plt.close(figure)
+
+            report("draw_tree + draw %s" % ("3D" if is_3d else "2D"), best_of(repeat, draw))
+            # The WebGL page, with plotly.js from its CDN so that the size
+            # shown is that of the graph alone
+            with tempfile.TemporaryDirectory() as tmp:
+                page = os.path.join(tmp, "graph.html")
+                report("render_html %s" % ("3D" if is_3d else "2D"),
+                       best_of(repeat, render.render_html, graph, page, is_3d, pos, None, False))
+                print("  %-28s %8.1f MB" % ("graph data", os.path.getsize(page) / (1024 * 1024)))
+
+def bench_pipeline(filename, repeat, memory=True):
+    """Each stage of the main.py pipeline on filename, from parse to canvas draw
+
+    Stage times are the best of repeat runs; peak memory comes from one
+    more run under tracemalloc, which would slow the timed ones down.
+    Returns the stages as StageTimer.results() does.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import core
+    import render
+    from profiling import StageTimer
+
+    def run(timer):
+        with timer.stage("parse"):
+            columns = gin.parse_columns(filename)
+        with timer.stage("tree"):
+            tree = core.build_compact_tree(columns)
+        with timer.stage("text"):
+            core.tree_text(tree, max_depth=3, max_lines=200)
+        with timer.stage("graph"):
+            graph = core.build_graph(tree)
+        with timer.stage("layout"):
+            pos = render.layout_graph(graph, is_3d=True)
+        with timer.stage("draw"):
+            figure = plt.figure(figsize=(10, 6))
+            ax = figure.add_subplot(111, projection="3d")
+            render.draw_tree(graph, ax, True, pos)
+        with timer.stage("canvas"):
+            figure.canvas.draw()
+        plt.close(figure)
+
+    best = {}
+    for _ in range(repeat):
+        timer = StageTimer()
+        run(timer)
+        for record in timer.results():
+            best[record["stage"]] = min(best.get(record["stage"], record["seconds"]), record["seconds"])
+    stages = [{"stage": stage, "seconds": seconds} for stage, seconds in best.items()]
+    if memory:
+        timer = StageTimer(memory=True)
+        run(timer)
+        for stage, record in zip(stages, timer.results()):
+            stage["peak_bytes"] = record["peak_bytes"]
+
+    print("pipeline stages:")
+    for stage in stages:
+        line = "  %-28s %8.3f s" % (stage["stage"], stage["seconds"])
+        if "peak_bytes" in stage:
+            line += "  %8.1f MB peak" % (stage["peak_bytes"] / (1024 * 1024))
+        print(line)
+    return stages
+
+def compare(results, baseline):
+    "Print each result's time against the same label's in an earlier --json file"
+    before = {result["label"]: result["seconds"] for result in baseline["results"]}
+    before.update(("stage " + stage["stage"], stage["seconds"]) for stage in baseline.get("stages", []))
+    now = [(result["label"], result["seconds"]) for result in results["results"]]
+    now += [("stage " + stage["stage"], stage["seconds"]) for stage in results.get("stages", [])]
+    print("against baseline:")
+    for label, seconds in now:
+        if label in before and seconds:
+            print("  %-28s %8.3f s  was %8.3f s  (%.2fx)" % (label, seconds, before[label], before[label] / seconds))
+
+def main():
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="benchmark git-index-viz")
+    parser.add_argument("-n", "--entries", type=int, default=300000,
+        help="entries in the synthetic index (default: 300000)")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+        help="runs per measurement, the best is reported (default: 3)")
+    parser.add_argument("-V", "--index-version", type=int, default=2, choices=(2, 3, 4),
+        help="format version of the synthetic index (default: 2)")
+    parser.add_argument("-j", "--jobs", type=lambda value: [int(n) for n in value.split(",")],
+        help="also time parallel parsing with these job counts, e.g. 2,4,8; "
+            "the synthetic index then gets one IEOT block per job of the largest count")
+    parser.add_argument("-l", "--layouts", action="store_true",
+        help="also time the graph layouts on synthetic trees of 1k, 10k and 100k nodes")
+    parser.add_argument("-R", "--render", action="store_true",
+        help="also time draw_tree plus a full canvas draw, and render_html, on synthetic trees of 1k, 10k and 100k nodes")
+    parser.add_argument("-s", "--search", action="store_true",
+        help="also time path search queries")
+    parser.add_argument("-D", "--diff", action="store_true",
+        help="also time diffing two synthetic indexes of the same size")
+    parser.add_argument("-w", "--worktree", action="store_true",
+        help="also time a worktree status scan against git status, on a repository of the same size")
+    parser.add_argument("-b", "--batch", type=int, metavar="REPOS",
+        help="also time batch summaries of this many indexes of the same size, with the --jobs counts")
+    parser.add_argument("-x", "--export", action="store_true",
+        help="also time the export backends")
+    parser.add_argument("-m", "--memory", action="store_true",
+        help="also measure the memory the tree builders use")
+    parser.add_argument("-S", "--startup", action="store_true",
+        help="also time cold starts: module imports and a headless render in fresh interpreters")
+    parser.add_argument("-p", "--pipeline", action="store_true",
+        help="also time each stage from parse to canvas draw, with its peak memory")
+    parser.add_argument("--depth", type=int, default=3,
+        help="directory levels above each file of the synthetic index (default: 3)")
+    parser.add_argument("--fanout", type=int, default=10,
+        help="subdirectories per directory of the synthetic index (default: 10)")
+    parser.add_argument("-E", "--extensions", default="TREE",
+        help="comma-separated index extensions of the synthetic index, of TREE and IEOT "
+            "(IEOT comes with EOIE; default: TREE)")
+    parser.add_argument("--skip-worktree", type=int, default=0, metavar="N",
+        help="set skip-worktree on every Nth entry of a version 3 or 4 synthetic index")
+    parser.add_argument("-g", "--generate", metavar="FILE",
+        help="only write the synthetic index to FILE")
+    parser.add_argument("--json", metavar="FILE",
+        help="also write the results to FILE as JSON, for --compare")
+    parser.add_argument("--compare", metavar="FILE",
+        help="compare the results with those of an earlier --json run")
+    parser.add_argument("index", nargs="?",
+        help="benchmark this index file instead of a synthetic one")
+    args = parser.parse_args()
+
+    extensions = {extension.strip().upper() for extension in args.extensions.split(",") if extension.strip()}
+    unknown = extensions - {"TREE", "IEOT"}
+    if unknown:
+        parser.error("unknown extensions: %s" % ", ".join(sorted(unknown)))
+    # Parallel parsing needs IEOT, with a block per job of the largest count
+    blocks = max(args.jobs) if args.jobs else 4 if "IEOT" in extensions else 0
+
+    def synthetic_index(filename):
+        write_index(filename, synthetic_names(args.entries, args.depth, args.fanout), args.index_version,
+            blocks, tree="TREE" in extensions, skip_worktree=args.skip_worktree)
+
+    if args.generate:
+        synthetic_index(args.generate)
+        return
+
+    def bench_index(filename):
+        bench_parse(filename, args.repeat)
+        bench_tree(filename, args.repeat)
+        if args.search:
+            bench_search(filename, args.repeat)
+        if args.export:
+            bench_export(filename, args.repeat)
+        if args.memory:
+            bench_memory(filename)
+        if args.jobs:
+            bench_parallel(filename, args.repeat, args.jobs)
+        return bench_pipeline(filename, args.repeat) if args.pipeline else []
+
+    if args.index:
+        stages = bench_index(args.index)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "index")
+            synthetic_index(filename)
+            stages = bench_index(filename)
+        if args.diff:
+            bench_diff(args.entries, args.repeat, args.index_version)
+        if args.worktree:
+            bench_status(args.entries, args.repeat)
+        if args.batch:
+            bench_batch(args.entries, args.batch, args.repeat, args.jobs)
+    if args.layouts:
+        bench_layouts(args.repeat)
+    if args.render:
+        bench_render(args.repeat)
+    if args.startup:
+        bench_startup(args.repeat)
+
+    results = {
+        "index": args.index,
+        "parameters": None if args.index else {
+            "entries": args.entries, "version": args.index_version, "depth": args.depth,
+            "fanout": args.fanout, "extensions": sorted(extensions), "blocks": blocks,
+            "skip_worktree": args.skip_worktree},
+        "python": sys.version.split()[0],
+        "cpus": os.cpu_count(),
+        "repeat": args.repeat,
+        "results": RESULTS,
+        "stages": stages,
+    }
+    if args.json:
+        with open(args.json, "w") as o:
+            json.dump(results, o, indent=1)
+    if args.compare:
+        with open(args.compare) as o:
+            compare(results, json.load(o))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,487 @@
+"core - the file tree of a parsed index, as text and as a graph"
+
+# Importing this needs only gin and the standard library. numpy and
+# networkx are imported where first used, so that parsing and the text
+# tree start fast; see render.py for drawing the graph.
+
+from array import array
+import heapq
+import itertools
+import sys
+
+import gin
+
+# Most nodes build_graph puts in a graph before collapsing directories
+NODE_BUDGET = 2000
+
+class CompactTree:
+    """A whole file tree in flat arrays, one slot per node in pre-order
+
+    Names are interned, so the many files and directories sharing a name
+    share one string. Each subtree occupies the contiguous slots from its
+    root up to ends[root], which makes subtree totals a difference of
+    prefix sums. Use root() to get a node view of it.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.parents = array('i')
+        self.first_child = array('i')
+        self.next_sibling = array('i')
+        self.ends = array('i')
+        self.sizes = array('Q')
+        self._totals = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def root(self):
+        return CompactNode(self, 0)
+
+    @classmethod
+    def from_preorder(cls, names, parents, sizes):
+        "The tree with these names, parent slots and sizes, listed in pre-order"
+        tree = cls()
+        count = len(names)
+        tree.names = [sys.intern(name) for name in names]
+        tree.parents = array('i', parents)
+        tree.sizes = array('Q', sizes)
+        tree.first_child = array('i', [-1]) * count
+        tree.next_sibling = array('i', [-1]) * count
+        tree.ends = array('i', range(1, count + 1))
+        # Backwards, so first_child ends up at the first child and every
+        # subtree's end has been carried up before its parent is reached
+        for n in range(count - 1, 0, -1):
+            parent = tree.parents[n]
+            tree.next_sibling[n] = tree.first_child[parent]
+            tree.first_child[parent] = n
+            if tree.ends[n] > tree.ends[parent]:
+                tree.ends[parent] = tree.ends[n]
+        return tree
+
+    def totals(self):
+        "subtree_totals() for this tree, computed with numpy and cached"
+        if self._totals is None:
+            import numpy as np
+
+            count = len(self.names)
+            is_file = np.frombuffer(self.first_child, dtype=np.int32) < 0 if count else np.zeros(0, dtype=bool)
+            sizes = np.frombuffer(self.sizes, dtype=np.uint64) if count else np.zeros(0, dtype=np.uint64)
+            ends = np.frombuffer(self.ends, dtype=np.int32) if count else np.zeros(0, dtype=np.int32)
+            starts = np.arange(count)
+            file_sums = np.concatenate(([0], np.cumsum(is_file, dtype=np.int64)))
+            size_sums = np.concatenate(([0], np.cumsum(np.where(is_file, sizes, 0), dtype=np.uint64)))
+            self._totals = CompactTotals(file_sums[ends] - file_sums[starts], size_sums[ends] - size_sums[starts])
+        return self._totals
+
+class CompactTotals:
+    "subtree_totals() of a CompactTree: (files, bytes) looked up by CompactNode"
+    __slots__ = ("files", "sizes")
+
+    def __init__(self, files, sizes):
+        self.files = files
+        self.sizes = sizes
+
+    def __getitem__(self, node):
+        return int(self.files[node.index]), int(self.sizes[node.index])
+
+class CompactNode:
+    "One node of a CompactTree, with the name, size and {name: node} children tree code walks"
+    __slots__ = ("tree", "index")
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    @property
+    def name(self):
+        return self.tree.names[self.index]
+
+    @name.setter
+    def name(self, name):
+        self.tree.names[self.index] = name
+
+    @property
+    def size(self):
+        return self.tree.sizes[self.index]
+
+    @property
+    def children(self):
+        "{name: CompactNode} of the children, made on each access"
+        tree = self.tree
+        children = {}
+        child = tree.first_child[self.index]
+        while child >= 0:
+            children[tree.names[child]] = CompactNode(tree, child)
+            child = tree.next_sibling[child]
+        return children
+
+    def __eq__(self, other):
+        return isinstance(other, CompactNode) and self.tree is other.tree and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.tree), self.index))
+
+    def __str__(self):
+        return tree_text(self)
+
+def node_tag(node):
+    return f"{node.name} ({node.size} bytes)" if node.size > 0 else node.name
+
+def iter_tree_lines(node, max_depth=None):
+    """(path, line) for each node under node, drawn as a text tree, lazily
+
+    path is the node's "/"-separated path below node ("" for node itself),
+    unique even where basenames repeat. Directories deeper than max_depth
+    are not descended into; their line ends with how many entries they
+    hold instead. Iterative, so any depth of tree is fine.
+    """
+    yield "", node_tag(node)
+    # Each open directory: its children, the next one to draw, the line
+    # prefix and the path prefix of its children
+    frames = [[list(node.children.values()), 0, "", ""]]
+    while frames:
+        frame = frames[-1]
+        children, n, prefix, path = frame
+        if n == len(children):
+            frames.pop()
+            continue
+        frame[1] = n + 1
+        child = children[n]
+        last = n == len(children) - 1
+        child_path = path + child.name
+        grandchildren = child.children
+        tag = node_tag(child)
+        open_child = grandchildren and (max_depth is None or len(frames) < max_depth)
+        if grandchildren and not open_child:
+            tag += f" [{len(grandchildren)} {'entry' if len(grandchildren) == 1 else 'entries'}]"
+        yield child_path, prefix + ("└── " if last else "├── ") + tag
+        if open_child:
+            frames.append([list(grandchildren.values()), 0, prefix + ("    " if last else "│   "),
+                           child_path + "/"])
+
+def tree_text(node, max_depth=None, max_lines=None):
+    "The lines of iter_tree_lines() as one string, at most max_lines of them"
+    lines = itertools.islice(iter_tree_lines(node, max_depth), max_lines)
+    return "".join(line + "\n" for _, line in lines)
+
+def repo_name_from_url(repo_url=None):
+    if repo_url is None:
+        return "root"
+    return repo_url.split('.git')[0].split('/')[-1]  # Get the current working directory's name
+
+def format_size(size):
+    "size in bytes as a short human-readable string"
+    for unit in ("bytes", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            break
+        size /= 1024
+    return f"{size} {unit}" if unit == "bytes" else f"{size:.1f} {unit}"
+
+def compact_tree_from_cache_tree(entries, cache_tree, repo_url=None):
+    """build_compact_tree() from the ranges of entries the TREE extension gives each directory
+
+    Each directory's entries are a known run, so no path is compared with
+    the one before it. None if a directory on the way has no valid range.
+    """
+    tree = CompactTree()
+    names = tree.names
+    first_child = tree.first_child
+    next_sibling = tree.next_sibling
+    ends = tree.ends
+    intern = sys.intern
+    add_name = names.append
+    add_parent = tree.parents.append
+    add_first_child = first_child.append
+    add_next_sibling = next_sibling.append
+    add_end = ends.append
+    add_size = tree.sizes.append
+    entry_names = entries.names()
+    entry_sizes = entries.size
+
+    add_name(repo_name_from_url(repo_url))
+    add_parent(-1)
+    add_first_child(-1)
+    add_next_sibling(-1)
+    add_end(1)
+    add_size(0)
+    # Each open directory: its slot, its subtrees by name, next entry, end
+    # of its range, the length of the path prefix its entries share and
+    # its last child so far. Git orders subtrees by name length first,
+    # hence the lookup by name
+    def subtrees(cache):
+        return {child.name: child for child in cache.children}
+    stack = [[0, subtrees(cache_tree), 0, cache_tree.entry_count, 0, -1]]
+    while stack:
+        frame = stack[-1]
+        slot, children, pos, end, prefix, last = frame
+        if pos >= end:
+            ends[slot] = len(names)
+            stack.pop()
+            continue
+        index = len(names)
+        if last < 0:
+            first_child[slot] = index
+        else:
+            next_sibling[last] = index
+        frame[5] = index
+        add_parent(slot)
+        add_first_child(-1)
+        add_next_sibling(-1)
+        add_end(index + 1)
+        name = entry_names[pos]
+        slash = name.find('/', prefix)
+        if slash < 0:
+            add_name(intern(name[prefix:]))
+            add_size(entry_sizes[pos])
+            frame[2] = pos + 1
+            continue
+        # A subdirectory starts here and covers the next entry_count entries
+        part = name[prefix:slash]
+        subtree = children.get(part)
+        if subtree is None or not subtree.valid():
+            return None
+        add_name(intern(part))
+        add_size(0)
+        frame[2] = pos + subtree.entry_count
+        stack.append([index, subtrees(subtree), pos, frame[2], slash + 1, -1])
+    return tree
+
+def build_compact_tree(entries, repo_url=None):
+    """The file tree of entries, from gin.parse_columns() or gin.parse(), as a CompactTree
+
+    Returns its root view. With a complete TREE extension,
+    compact_tree_from_cache_tree() builds it from directory ranges.
+    Otherwise it is a single pass over the sorted entries: the stack holds
+    the slots of the directories along the previous path, and only the
+    path components past the directories it shares with the previous one
+    are looked at.
+    """
+    if isinstance(entries, gin.IndexColumns):
+        cache_tree = entries.cache_tree()
+        if cache_tree is not None and cache_tree.entry_count == len(entries):
+            tree = compact_tree_from_cache_tree(entries, cache_tree, repo_url)
+            if tree is not None:
+                return tree.root()
+
+    tree = CompactTree()
+
+    names = tree.names
+    first_child = tree.first_child
+    next_sibling = tree.next_sibling
+    ends = tree.ends
+    intern = sys.intern
+    add_name = names.append
+    add_parent = tree.parents.append
+    add_first_child = first_child.append
+    add_next_sibling = next_sibling.append
+    add_end = ends.append
+    add_size = tree.sizes.append
+
+    if isinstance(entries, gin.IndexColumns):
+        files = zip(entries.names(), entries.size, entries.shared_directories())
+    else:
+        files = ((entry["name"], entry.get("size", 0), None) for entry in entries if "name" in entry)
+
+    add_name(repo_name_from_url(repo_url))
+    add_parent(-1)
+    add_first_child(-1)
+    add_next_sibling(-1)
+    add_end(1)
+    add_size(0)
+    # Slots of the directories along the previous path, and of the last
+    # child added to each, which the next child is linked after
+    stack = [0]
+    last = [-1]
+    previous_name = None
+    previous_parts = []
+    for name, file_size, shared in files:
+        if name == previous_name:
+            # Another stage of a conflicted path
+            continue
+        parts = name.split('/')
+        if shared is None:
+            shared = 0
+            limit = min(len(parts), len(previous_parts)) - 1
+            while shared < limit and parts[shared] == previous_parts[shared]:
+                shared += 1
+        if len(stack) > shared + 1:
+            # Sorted paths visit each directory in one run, so a directory
+            # that is left is complete and new components are new directories
+            for directory in stack[shared + 1:]:
+                ends[directory] = len(names)
+            del stack[shared + 1:]
+            del last[shared + 1:]
+        for part in parts[shared:]:
+            index = len(names)
+            parent = stack[-1]
+            if last[-1] < 0:
+                first_child[parent] = index
+            else:
+                next_sibling[last[-1]] = index
+            last[-1] = index
+            add_name(intern(part))
+            add_parent(parent)
+            add_first_child(-1)
+            add_next_sibling(-1)
+            add_end(index + 1)
+            if len(stack) < len(parts):
+                add_size(0)
+                stack.append(index)
+                last.append(-1)
+            else:
+                add_size(file_size)
+        previous_name = name
+        previous_parts = parts
+    for directory in stack:
+        ends[directory] = len(names)
+    return tree.root()
+
+def changed_nodes(old_entries, new_entries, diff):
+    """build_graph keys of the nodes a gin.diff_columns() result adds, removes or changes
+
+    These are the paths of the changed files and of the directories along
+    them, bar the root.
+    """
+    affected = set()
+    names = [old_entries.name(n) for n in diff.removed]
+    names += [new_entries.name(n) for n in diff.added]
+    names += [new_entries.name(n) for _, n in diff.modified + diff.mode_changed]
+    for name in names:
+        slash = name.find('/')
+        while slash >= 0:
+            affected.add(name[:slash])
+            slash = name.find('/', slash + 1)
+        affected.add(name)
+    return affected
+
+def subtree_totals(tree):
+    """{node: (files, bytes)} under every node of tree, in one post-order pass
+
+    Nodes only have a size if they are files, so this is where
+    directories get their sizes from.
+    """
+    if isinstance(tree, CompactNode):
+        return tree.tree.totals()
+    totals = {}
+    pending = [(tree, False)]
+    while pending:
+        node, visited = pending.pop()
+        if not node.children:
+            totals[node] = (1, node.size)
+        elif visited:
+            files = size = 0
+            for child in node.children.values():
+                child_files, child_size = totals[child]
+                files += child_files
+                size += child_size
+            totals[node] = (files, size)
+        else:
+            pending.append((node, True))
+            pending.extend((child, False) for child in node.children.values())
+    return totals
+
+def summary_label(name, files, size):
+    return f"{name}\n{files} files, {format_size(size)}"
+
+def join_path(directory, name):
+    "The path of name inside directory, a path below the root (\"\" for the root itself)"
+    return f"{directory}/{name}" if directory else name
+
+def summary_key(directory):
+    """The graph node summarizing the children of directory left out by build_graph
+
+    Git never stores a path ending in "/", so this cannot clash with one.
+    """
+    return directory + "/"
+
+def build_graph(tree, budget=NODE_BUDGET, expanded=(), totals=None):
+    """A networkx DiGraph of tree, directories to their children, with at most about budget nodes
+
+    Nodes are keyed by their path below tree, "" for tree itself, so files
+    and directories sharing a name stay apart; the name is in the label.
+    Directories are expanded largest first while their children fit in
+    the budget; the rest stay as single summary nodes ("N files, X MB")
+    with collapsed=True. A directory whose children do not all fit shows
+    its largest ones and one summary node for the others, keyed by
+    summary_key(). Directories whose paths are in expanded are opened
+    first and regardless of the budget, though still showing at most
+    budget children.
+    """
+    import networkx as nx
+
+    if totals is None:
+        totals = subtree_totals(tree)
+    expanded = set(expanded)
+    graph = nx.DiGraph()
+
+    def add(node, path, parent):
+        files, size = totals[node]
+        if node.children:
+            graph.add_node(path, label=summary_label(node.name, files, size), size=size,
+                           color='green', shape='o', collapsed=True)
+            # Expansion order: requested ones first, then by size; the
+            # counter keeps nodes themselves from ever being compared
+            heapq.heappush(frontier, (path not in expanded, -size, next(order), path, node))
+        else:
+            label = f"{node.name}\n({node.size} bytes)" if node.size > 0 else node.name
+            color = 'red' if node.size > 0 else 'green'
+            graph.add_node(path, label=label, size=node.size, color=color, shape='o')
+        if parent is not None:
+            graph.add_edge(parent, path, color='blue', style='solid')
+
+    frontier = []
+    order = itertools.count()
+    add(tree, "", None)
+    while frontier:
+        optional, _, _, path, node = heapq.heappop(frontier)
+        room = budget - len(graph)
+        if optional and room < 2 and node is not tree:
+            continue
+        children = sorted(node.children.values(), key=lambda child: totals[child][1], reverse=True)
+        limit = room if optional else max(room, budget)
+        # Keep a place for the summary of the children left out
+        shown = children if len(children) <= limit else children[:max(limit - 1, 1)]
+        graph.nodes[path].update(label=node.name, collapsed=False)
+        for child in shown:
+            add(child, join_path(path, child.name), path)
+        rest = children[len(shown):]
+        if rest:
+            files = sum(totals[child][0] for child in rest)
+            size = sum(totals[child][1] for child in rest)
+            summary = summary_key(path)
+            graph.add_node(summary, label=summary_label(f"{len(rest)} more", files, size), size=size,
+                           color='green', shape='o', collapsed=True, parent=path)
+            graph.add_edge(path, summary, color='blue', style='solid')
+    return graph
+
+def node_for_path(graph, path):
+    """The build_graph node showing path: its own, or the collapsed directory or summary holding it
+
+    Walks down from the root one path component at a time. None if graph
+    has no root node.
+    """
+    if "" not in graph:
+        return None
+    node = ""
+    for part in path.split('/'):
+        child = join_path(node, part)
+        if child not in graph:
+            summary = summary_key(node)
+            return summary if summary in graph else node
+        node = child
+    return node
+
+def mark_status(graph, dirty):
+    """Set the status attribute draw_tree colours by from {path: status name}
+
+    A collapsed directory holding any dirty file is marked modified.
+    """
+    for path, status in dirty.items():
+        node = node_for_path(graph, path)
+        if node is None:
+            continue
+        if node != path:
+            status = "modified"
+        if graph.nodes[node].get('status') != "modified":
+            graph.nodes[node]['status'] = status
@@ -0,0 +1,159 @@
+"export - write index entries as NDJSON, CSV or numpy .npz"
+
+# Every backend works from a gin.IndexColumns and only touches the columns
+# of the fields asked for, so exporting sizes alone never decodes a name.
+# Text formats are written in chunks of rows through one buffered binary
+# stream rather than a print() per entry.
+
+import binascii
+import csv
+import io
+import itertools
+import sys
+from json.encoder import encode_basestring
+
+import gin
+
+FIELDS = ("entry", "ctime_seconds", "ctime_nanoseconds", "mtime_seconds", "mtime_nanoseconds",
+    "dev", "ino", "mode", "uid", "gid", "size", "sha1", "flags", "extra_flags",
+    "stage", "assume_valid", "skip_worktree", "intent_to_add", "name")
+
+# Bits of the derived boolean fields, in flags or extra_flags
+FLAG_BITS = {
+    "assume_valid": ("flags", gin.ASSUME_VALID),
+    "skip_worktree": ("extra_flags", gin.SKIP_WORKTREE),
+    "intent_to_add": ("extra_flags", gin.INTENT_TO_ADD),
+}
+
+# Rows formatted before each write
+CHUNK = 8192
+
+BOOL_TEXT = ("false", "true")
+
+def parse_fields(text):
+    "Field names from a comma-separated list, all of FIELDS if empty"
+    if not text:
+        return FIELDS
+    fields = tuple(field.strip().replace("-", "_") for field in text.split(","))
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown:
+        raise ValueError("unknown fields: %s (choose from %s)" % (", ".join(unknown), ", ".join(FIELDS)))
+    return fields
+
+def values(columns, field):
+    "One field of every entry, as an iterable of ints, bools or strs"
+    if field == "entry":
+        return range(1, len(columns) + 1)
+    if field == "sha1":
+        digits = binascii.hexlify(columns.sha1).decode("ascii")
+        return (digits[n:n + 40] for n in range(0, len(digits), 40))
+    if field == "stage":
+        return ((flags & gin.STAGE_MASK) >> gin.STAGE_SHIFT for flags in columns.flags)
+    if field in FLAG_BITS:
+        name, bit = FLAG_BITS[field]
+        return (bool(flags & bit) for flags in getattr(columns, name))
+    if field == "name":
+        data = columns.name_data
+        offsets = columns.name_offsets
+        return (data[offsets[n]:offsets[n + 1]].decode("utf-8", "replace") for n in range(len(columns)))
+    return getattr(columns, field)
+
+def chunks(rows, size=CHUNK):
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+def write_ndjson(columns, out, fields=FIELDS):
+    "One JSON object per line on the binary stream out"
+    # Each line is a %-template over the row, with strings pre-quoted
+    parts = []
+    sources = []
+    for field in fields:
+        column = values(columns, field)
+        if field == "sha1":
+            parts.append('"%s": "%%s"' % field)
+        elif field == "name":
+            parts.append('"%s": %%s' % field)
+            column = map(encode_basestring, column)
+        elif field in FLAG_BITS:
+            parts.append('"%s": %%s' % field)
+            column = (BOOL_TEXT[value] for value in column)
+        else:
+            parts.append('"%s": %%d' % field)
+        sources.append(column)
+    template = "{" + ", ".join(parts) + "}\n"
+    for chunk in chunks(zip(*sources)):
+        out.write("".join([template % row for row in chunk]).encode("utf-8"))
+
+def write_csv(columns, out, fields=FIELDS):
+    "A header line, then one line per entry, on the binary stream out"
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="", write_through=True)
+    writer = csv.writer(text)
+    writer.writerow(fields)
+    sources = []
+    for field in fields:
+        column = values(columns, field)
+        if field in FLAG_BITS:
+            column = (BOOL_TEXT[value] for value in column)
+        sources.append(column)
+    for chunk in chunks(zip(*sources)):
+        writer.writerows(chunk)
+    # Leave out open for the caller
+    text.detach()
+
+def arrays(columns, fields=FIELDS):
+    """{name: numpy array} for fields, sharing memory with columns where it can
+
+    Names stay undecoded: name_data holds their UTF-8 bytes back to back
+    and name n is name_data[name_offsets[n]:name_offsets[n + 1]]. sha1 is
+    an (entries, 20) array of bytes.
+    """
+    import numpy as np
+
+    result = {}
+    for field in fields:
+        if field == "entry":
+            result[field] = np.arange(1, len(columns) + 1, dtype=np.uint32)
+        elif field == "sha1":
+            result[field] = np.frombuffer(bytes(columns.sha1), dtype=np.uint8).reshape(-1, 20)
+        elif field == "stage":
+            result[field] = ((columns.column("flags") & gin.STAGE_MASK) >> gin.STAGE_SHIFT).astype(np.uint8)
+        elif field in FLAG_BITS:
+            name, bit = FLAG_BITS[field]
+            result[field] = columns.column(name) & bit != 0
+        elif field == "name":
+            result["name_data"] = np.frombuffer(bytes(columns.name_data), dtype=np.uint8)
+            result["name_offsets"] = columns.column("name_offsets")
+        else:
+            result[field] = columns.column(field)
+    return result
+
+def write_npz(columns, out, fields=FIELDS):
+    "An uncompressed numpy .npz archive with one array per field on the binary stream out"
+    import numpy as np
+
+    np.savez(out, **arrays(columns, fields))
+
+WRITERS = {
+    "ndjson": write_ndjson,
+    "csv": write_csv,
+    "npz": write_npz,
+}
+
+def export(columns, out, format="ndjson", fields=FIELDS):
+    "Write the fields of every entry of columns to the binary stream out in format"
+    WRITERS[format](columns, out, fields)
+
+def export_file(filename, output=None, format="ndjson", fields=FIELDS):
+    "Export the index at filename to the file output, or stdout if None"
+    columns = gin.parse_columns(filename)
+    if output is None:
+        sys.stdout.flush()
+        export(columns, sys.stdout.buffer, format, fields)
+        sys.stdout.buffer.flush()
+        return
+    with open(output, "wb", buffering=1 << 20) as out:
+        export(columns, out, format, fields)
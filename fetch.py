@@ -0,0 +1,86 @@
+"fetch - get just enough of a repository to read its index"
+
+import os
+import time
+
+import git
+
+# Local repositories only honour --filter if their upload-pack allows it
+FILTER_UPLOAD_PACK = "git -c uploadpack.allowFilter=true upload-pack"
+
+def clone_url(repo_url):
+    """The URL to clone repo_url from
+
+    Plain local paths become file:// URLs, since git ignores --depth and
+    --filter for local clones and hard-links the whole object store instead.
+    """
+    if os.path.isdir(repo_url):
+        return "file://" + os.path.abspath(repo_url)
+    return repo_url
+
+def directory_size(path):
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(directory, name))
+            except OSError:
+                pass
+    return total
+
+def clone_for_index(repo_url, path, shallow=False):
+    """Clone repo_url into path, leaving a .git/index to visualize
+
+    With shallow, only the latest commit and its trees are fetched (depth 1,
+    no blobs, no checkout) and the index is built from the commit's tree.
+    Index entries then have no stat data, so file sizes read as 0.
+    Returns the git.Repo and a dict with the seconds taken and the bytes
+    of objects received.
+    """
+    url = clone_url(repo_url)
+    start = time.perf_counter()
+    if shallow:
+        options = {"depth": 1, "filter": "blob:none", "no_checkout": True}
+        if url.startswith("file://"):
+            # GitPython refuses --upload-pack unless told it is intended
+            options["upload_pack"] = FILTER_UPLOAD_PACK
+            options["allow_unsafe_options"] = True
+        repo = git.Repo.clone_from(url, path, **options)
+        # Only tree objects are needed for this, and those were fetched
+        repo.git.read_tree("HEAD")
+    else:
+        repo = git.Repo.clone_from(url, path)
+    stats = {
+        "seconds": time.perf_counter() - start,
+        "bytes": directory_size(os.path.join(repo.git_dir, "objects")),
+    }
+    return repo, stats
+
+def refresh_for_index(repo):
+    """Bring a clone made by clone_for_index up to date with its remote
+
+    Only what changed since the last fetch is transferred, fetching the
+    same way the clone was made; the index is then reset to the new
+    commit. Returns a dict with the seconds taken and the bytes of
+    objects received.
+    """
+    objects = os.path.join(repo.git_dir, "objects")
+    before = directory_size(objects)
+    start = time.perf_counter()
+    url = repo.remotes.origin.url
+    shallow = os.path.isfile(os.path.join(repo.git_dir, "shallow"))
+    options = {}
+    if shallow:
+        options = {"depth": 1, "filter": "blob:none"}
+        if url.startswith("file://"):
+            options["upload_pack"] = FILTER_UPLOAD_PACK
+    repo.git.fetch("origin", "HEAD", **options)
+    if shallow:
+        repo.git.reset("--soft", "FETCH_HEAD")
+        repo.git.read_tree("HEAD")
+    else:
+        repo.git.reset("--hard", "FETCH_HEAD")
+    return {
+        "seconds": time.perf_counter() - start,
+        "bytes": max(directory_size(objects) - before, 0),
+    }
@@ -3,20 +3,89 @@ version = "0.1.006"
 
 # https://github.com/git/git/blob/master/Documentation/technical/index-format.txt
 
+import array
 import binascii
+import bisect
 import collections
+import concurrent.futures
+import hashlib
+import itertools
 import json
 import mmap
+import os
 import struct
 import sys
 
+# Fixed-size start of every entry: ten 32-bit stat fields (ctime and mtime
+# seconds/nanoseconds, dev, ino, mode, uid, gid, size), then the 20-byte SHA-1
+# and the 16-bit flags -- 62 bytes in all
+ENTRY_STAT_FIELDS = ("ctime_seconds", "ctime_nanoseconds",
+    "mtime_seconds", "mtime_nanoseconds",
+    "dev", "ino", "mode", "uid", "gid", "size")
+ENTRY_HEADER = struct.Struct("! 10I 20s H")
+UINT16 = struct.Struct("! H")
+UINT32 = struct.Struct("! I")
+NULL_SHA1 = "0" * 40
+
+# Bits of an entry's flags, above its 12-bit name length; the stage is
+# (flags & STAGE_MASK) >> STAGE_SHIFT, nonzero for unmerged entries
+ASSUME_VALID = 0b10000000 << 8
+EXTENDED = 0b01000000 << 8
+STAGE_MASK = 0b00110000 << 8
+STAGE_SHIFT = 12
+# Bits of an entry's extra_flags, which only extended entries have
+RESERVED = 0b10000000 << 8
+SKIP_WORKTREE = 0b01000000 << 8
+INTENT_TO_ADD = 0b00100000 << 8
+
 def check(boolean, message):
     if not boolean:
         import sys
         print("error: " + message, file=sys.stderr)
         sys.exit(1)
 
-def parse(filename, pretty=True):
+def decode_varint(buf, pos):
+    "Decode the varint at buf[pos]; return it and the position after it"
+    # Git's offset encoding (varint.c): each continuation adds one before
+    # shifting, so there is exactly one encoding per value
+    byte = buf[pos]
+    pos += 1
+    value = byte & 0x7F
+    while byte & 0x80:
+        byte = buf[pos]
+        pos += 1
+        value = ((value + 1) << 7) | (byte & 0x7F)
+    return value, pos
+
+class StreamingHash:
+    "SHA-1 of a mmap, fed in large zero-copy chunks as parsing moves through it"
+
+    def __init__(self, f, chunk=1 << 20):
+        self.view = memoryview(f)
+        self.sha1 = hashlib.sha1()
+        self.hashed = 0
+        self.chunk = chunk
+
+    def advance(self, pos):
+        if pos - self.hashed >= self.chunk:
+            self.sha1.update(self.view[self.hashed:pos])
+            self.hashed = pos
+
+    def finish(self, end):
+        "Hash up to end and return the hex digest; the mmap can then be closed"
+        self.sha1.update(self.view[self.hashed:end])
+        self.view.release()
+        return self.sha1.hexdigest()
+
+def verify_checksum(hasher, f):
+    "Finish hasher over everything before the trailing checksum and compare"
+    computed = hasher.finish(len(f) - 20)
+    stored = binascii.hexlify(f[len(f) - 20:]).decode("ascii")
+    # With index.skipHash git writes a null checksum instead
+    check(stored == NULL_SHA1 or computed == stored,
+        "Index checksum mismatch: %s != %s" % (computed, stored))
+
+def parse(filename, pretty=True, verify=False):
     with open(filename, "rb") as o:
         f = mmap.mmap(o.fileno(), 0, access=mmap.ACCESS_READ) if sys.platform == 'win32' else mmap.mmap(o.fileno(), 0, prot=mmap.PROT_READ)
 
@@ -27,6 +96,8 @@ def parse(filename, pretty=True):
             bytes = f.read(struct.calcsize(format))
             return struct.unpack(format, bytes)[0]
 
+        hasher = StreamingHash(f) if verify else None
+
         index = collections.OrderedDict()
 
         # 4-byte signature, b"DIRC"
@@ -35,7 +106,7 @@ def parse(filename, pretty=True):
 
         # 4-byte version number
         index["version"] = read("I")
-        check(index["version"] in {2, 3},
+        check(index["version"] in {2, 3, 4},
             "Unsupported version: %s" % index["version"])
 
         # 32-bit number of index entries, i.e. 4-byte
@@ -43,6 +114,10 @@ def parse(filename, pretty=True):
 
         yield index
 
+        # Version 4 names are stored as a change to the previous name, which
+        # is kept here and edited in place rather than rebuilt each time
+        previous_name = bytearray()
+
         for n in range(index["entries"]):
             entry = collections.OrderedDict()
 
@@ -80,32 +155,45 @@ def parse(filename, pretty=True):
             entry["flags"] = read("H")
 
             # 1-bit assume-valid
-            entry["assume-valid"] = bool(entry["flags"] & (0b10000000 << 8))
+            entry["assume-valid"] = bool(entry["flags"] & ASSUME_VALID)
             # 1-bit extended, must be 0 in version 2
-            entry["extended"] = bool(entry["flags"] & (0b01000000 << 8))
+            entry["extended"] = bool(entry["flags"] & EXTENDED)
             # 2-bit stage (?)
-            stage_one = bool(entry["flags"] & (0b00100000 << 8))
-            stage_two = bool(entry["flags"] & (0b00010000 << 8))
-            entry["stage"] = stage_one, stage_two
+            stage = (entry["flags"] & STAGE_MASK) >> STAGE_SHIFT
+            entry["stage"] = bool(stage & 0b10), bool(stage & 0b01)
             # 12-bit name length, if the length is less than 0xFFF (else, 0xFFF)
             namelen = entry["flags"] & 0xFFF
 
             # 62 bytes so far
             entrylen = 62
 
-            if entry["extended"] and (index["version"] == 3):
+            if entry["extended"] and (index["version"] >= 3):
                 entry["extra-flags"] = read("H")
                 # 1-bit reserved
-                entry["reserved"] = bool(entry["extra-flags"] & (0b10000000 << 8))
+                entry["reserved"] = bool(entry["extra-flags"] & RESERVED)
                 # 1-bit skip-worktree
-                entry["skip-worktree"] = bool(entry["extra-flags"] & (0b01000000 << 8))
+                entry["skip-worktree"] = bool(entry["extra-flags"] & SKIP_WORKTREE)
                 # 1-bit intent-to-add
-                entry["intent-to-add"] = bool(entry["extra-flags"] & (0b00100000 << 8))
+                entry["intent-to-add"] = bool(entry["extra-flags"] & INTENT_TO_ADD)
                 # 13-bits unused
                 # used = entry["extra-flags"] & (0b11100000 << 8)
                 # check(not used, "Expected unused bits in extra-flags")
                 entrylen += 2
 
+            if index["version"] == 4:
+                # Varint count of bytes to strip from the end of the previous
+                # name, then the NUL-terminated suffix to append. No padding
+                strip, pos = decode_varint(f, f.tell())
+                end = f.find(b"\x00", pos)
+                del previous_name[len(previous_name) - strip:]
+                previous_name += f[pos:end]
+                f.seek(end + 1)
+                entry["name"] = previous_name.decode("utf-8", "replace")
+                if hasher:
+                    hasher.advance(f.tell())
+                yield entry
+                continue
+
             if namelen < 0xFFF:
                 entry["name"] = f.read(namelen).decode("utf-8", "replace")
                 entrylen += namelen
@@ -124,6 +212,8 @@ def parse(filename, pretty=True):
             nuls = f.read(padlen)
             check(set(nuls) == {0}, "padding contained non-NUL")
 
+            if hasher:
+                hasher.advance(f.tell())
             yield entry
 
         indexlen = len(f)
@@ -138,6 +228,10 @@ def parse(filename, pretty=True):
             # Seems to exclude the above:
             # "src_offset += 8; src_offset += extsize;"
             extension["data"] = f.read(extension["size"])
+            decoded = decode_extension(extension["signature"], extension["data"])
+            if decoded:
+                extension.update(decoded)
+                extension.move_to_end("data")
             extension["data"] = extension["data"].decode("iso-8859-1")
             if pretty:
                 extension["data"] = json.dumps(extension["data"])
@@ -147,12 +241,468 @@ def parse(filename, pretty=True):
 
         checksum = collections.OrderedDict()
         checksum["checksum"] = True
+        if hasher:
+            verify_checksum(hasher, f)
+            checksum["verified"] = True
         checksum["sha1"] = binascii.hexlify(f.read(20)).decode("ascii")
         yield checksum
 
         f.close()
 
-def parse_file(arg, pretty=True):
+class IndexColumns:
+    "Index entries decoded column by column rather than one dict per entry"
+
+    def __init__(self, version):
+        self.version = version
+        for field in ENTRY_STAT_FIELDS:
+            setattr(self, field, array.array("I"))
+        # 20 bytes per entry, back to back
+        self.sha1 = bytearray()
+        self.flags = array.array("H")
+        # 0 for entries without the extended flag
+        self.extra_flags = array.array("H")
+        # Name n is name_data[name_offsets[n]:name_offsets[n + 1]]
+        self.name_offsets = array.array("Q", [0])
+        self.name_data = bytearray()
+        # Bytes each name shares with the previous one, for version 4 only
+        self.prefix_lengths = array.array("I") if version == 4 else None
+        # (signature, data) pairs, in file order
+        self.extensions = []
+        self.checksum = None
+
+    def __len__(self):
+        return len(self.flags)
+
+    def __eq__(self, other):
+        return isinstance(other, IndexColumns) and vars(self) == vars(other)
+
+    def extend(self, other):
+        "Append the entries of other, such as a separately decoded block"
+        import numpy as np
+
+        base = self.name_offsets[-1]
+        for field in ENTRY_STAT_FIELDS:
+            getattr(self, field).extend(getattr(other, field))
+        self.sha1 += other.sha1
+        self.flags.extend(other.flags)
+        self.extra_flags.extend(other.extra_flags)
+        # Past the names already here, shifted in one add rather than per entry
+        self.name_offsets.frombytes((other.column("name_offsets")[1:] + np.uint64(base)).tobytes())
+        self.name_data += other.name_data
+        if self.prefix_lengths is not None:
+            self.prefix_lengths.extend(other.prefix_lengths)
+
+    def column(self, field):
+        "A field of every entry as a numpy array, sharing memory with its array.array"
+        import numpy as np
+
+        data = getattr(self, field)
+        return np.frombuffer(data, dtype=np.dtype(data.typecode)) if len(data) else np.zeros(0, dtype=data.typecode)
+
+    def name_bytes(self, n):
+        return bytes(self.name_data[self.name_offsets[n]:self.name_offsets[n + 1]])
+
+    def name(self, n):
+        return self.name_bytes(n).decode("utf-8", "replace")
+
+    def names(self):
+        data = self.name_data
+        offsets = self.name_offsets
+        return [data[offsets[n]:offsets[n + 1]].decode("utf-8", "replace")
+            for n in range(len(self))]
+
+    def sha1_hex(self, n):
+        return binascii.hexlify(self.sha1[20 * n:20 * n + 20]).decode("ascii")
+
+    def entry(self, n, pretty=True):
+        "Entry n as the same OrderedDict that parse() yields for it"
+        entry = collections.OrderedDict()
+        entry["entry"] = n + 1
+        if pretty:
+            entry["ctime"] = self.ctime_seconds[n] + self.ctime_nanoseconds[n] / 1000000000
+            entry["mtime"] = self.mtime_seconds[n] + self.mtime_nanoseconds[n] / 1000000000
+        else:
+            entry["ctime_seconds"] = self.ctime_seconds[n]
+            entry["ctime_nanoseconds"] = self.ctime_nanoseconds[n]
+            entry["mtime_seconds"] = self.mtime_seconds[n]
+            entry["mtime_nanoseconds"] = self.mtime_nanoseconds[n]
+        for field in ENTRY_STAT_FIELDS[4:]:
+            entry[field] = getattr(self, field)[n]
+        if pretty:
+            entry["mode"] = "%06o" % entry["mode"]
+        entry["sha1"] = self.sha1_hex(n)
+        flags = entry["flags"] = self.flags[n]
+        entry["assume-valid"] = bool(flags & ASSUME_VALID)
+        entry["extended"] = bool(flags & EXTENDED)
+        stage = (flags & STAGE_MASK) >> STAGE_SHIFT
+        entry["stage"] = bool(stage & 0b10), bool(stage & 0b01)
+        if entry["extended"] and (self.version >= 3):
+            extra_flags = entry["extra-flags"] = self.extra_flags[n]
+            entry["reserved"] = bool(extra_flags & RESERVED)
+            entry["skip-worktree"] = bool(extra_flags & SKIP_WORKTREE)
+            entry["intent-to-add"] = bool(extra_flags & INTENT_TO_ADD)
+        entry["name"] = self.name(n)
+        return entry
+
+    def entries(self, pretty=True):
+        for n in range(len(self)):
+            yield self.entry(n, pretty=pretty)
+
+    def cache_tree(self):
+        "Root CacheTree from the TREE extension, or None if there is none"
+        for signature, data in self.extensions:
+            if signature == "TREE":
+                return parse_cache_tree(data)
+        return None
+
+    def shared_directories(self):
+        "Per entry, how many leading directories it shares with the previous one"
+        if self.prefix_lengths is None:
+            return itertools.repeat(None, len(self))
+        data = self.name_data
+        offsets = self.name_offsets
+        # Every "/" inside the common prefix closes a directory both names share
+        return (data.count(b"/", offsets[n], offsets[n] + shared)
+            for n, shared in enumerate(self.prefix_lengths))
+
+def open_index(o):
+    "Read-only mmap of an open index file"
+    return mmap.mmap(o.fileno(), 0, access=mmap.ACCESS_READ) if sys.platform == 'win32' else mmap.mmap(o.fileno(), 0, prot=mmap.PROT_READ)
+
+def decode_entries(f, version, pos, count, hasher=None):
+    "Decode count entries starting at f[pos]; return an IndexColumns and the end"
+    columns = IndexColumns(version)
+    stat = bytearray()
+    sha1 = columns.sha1
+    flags_column = columns.flags
+    extra_flags_column = columns.extra_flags
+    offsets = columns.name_offsets
+    names = columns.name_data
+    prefix_lengths = columns.prefix_lengths
+    previous_name = bytearray()
+    unpack_flags = UINT16.unpack_from
+
+    # Only the variable-length part of each entry is walked here; the
+    # fixed fields are gathered as raw bytes and decoded in one go below
+    for n in range(count):
+        if hasher:
+            hasher.advance(pos)
+        stat += f[pos:pos + 40]
+        sha1 += f[pos + 40:pos + 60]
+        flags = unpack_flags(f, pos + 60)[0]
+        flags_column.append(flags)
+        start = pos + 62
+        if (flags & EXTENDED) and (version >= 3):
+            extra_flags_column.append(unpack_flags(f, start)[0])
+            start += 2
+        else:
+            extra_flags_column.append(0)
+
+        if version == 4:
+            strip, start = decode_varint(f, start)
+            end = f.find(b"\x00", start)
+            # The first entry of a block ignores the previous name, which
+            # may belong to another block (see IEOT)
+            keep = len(previous_name) - strip if n else 0
+            del previous_name[keep:]
+            previous_name += f[start:end]
+            names += previous_name
+            offsets.append(len(names))
+            prefix_lengths.append(keep)
+            pos = end + 1
+            continue
+
+        namelen = flags & 0xFFF
+        if namelen < 0xFFF:
+            end = start + namelen
+        else:
+            end = f.find(b"\x00", start)
+        names += f[start:end]
+        offsets.append(len(names))
+
+        # Entries are NUL-padded to a multiple of eight bytes
+        pos += ((end - pos) + 8) & ~7
+
+    stat = array.array("I", stat)
+    if sys.byteorder == "little":
+        stat.byteswap()
+    for i, field in enumerate(ENTRY_STAT_FIELDS):
+        setattr(columns, field, stat[i::len(ENTRY_STAT_FIELDS)])
+    return columns, pos
+
+class CacheTree:
+    "One directory of the TREE (cache tree) extension"
+
+    def __init__(self, name, entry_count, subtree_count, sha1=None):
+        # Path component relative to the parent; "" for the root
+        self.name = name
+        # Index entries covered by this directory, or -1 if invalidated
+        self.entry_count = entry_count
+        self.subtree_count = subtree_count
+        # Tree object id, None when invalidated
+        self.sha1 = sha1
+        self.children = []
+
+    def valid(self):
+        return self.entry_count >= 0
+
+def iter_cache_tree(data):
+    "(name, entry_count, subtree_count, sha1) of each TREE record, depth first"
+    pos = 0
+    while pos < len(data):
+        # NUL-terminated path component, then "<entry_count> <subtrees>\n"
+        nul = data.index(b"\x00", pos)
+        newline = data.index(b"\n", nul)
+        name = data[pos:nul].decode("utf-8", "replace")
+        entry_count, subtree_count = data[nul + 1:newline].split(b" ")
+        entry_count = int(entry_count)
+        pos = newline + 1
+        # Invalidated entries have a negative count and no object name
+        sha1 = None
+        if entry_count >= 0:
+            sha1 = binascii.hexlify(data[pos:pos + 20]).decode("ascii")
+            pos += 20
+        yield name, entry_count, int(subtree_count), sha1
+
+def parse_cache_tree(data):
+    "Decode the TREE extension data into its root CacheTree"
+    root = None
+    # Directories whose subtrees have not all been read yet
+    open_trees = []
+    for record in iter_cache_tree(data):
+        tree = CacheTree(*record)
+        if open_trees:
+            open_trees[-1].children.append(tree)
+        else:
+            root = tree
+        open_trees.append(tree)
+        while open_trees and len(open_trees[-1].children) == open_trees[-1].subtree_count:
+            open_trees.pop()
+    return root
+
+def decode_extension(signature, data):
+    "Structured fields of an extension gin understands, else None"
+    if signature == "EOIE":
+        # 32-bit offset of the first extension, then a hash over the
+        # signatures and sizes of the extensions before this one
+        return collections.OrderedDict([
+            ("offset", UINT32.unpack_from(data)[0]),
+            ("hash", binascii.hexlify(data[4:24]).decode("ascii")),
+        ])
+    if signature == "TREE":
+        return collections.OrderedDict([
+            ("trees", [collections.OrderedDict(zip(
+                ("name", "entry_count", "subtree_count", "sha1"), record))
+                for record in iter_cache_tree(data)]),
+        ])
+    if signature == "IEOT":
+        # 32-bit version, then (offset, count) of each block of entries
+        return collections.OrderedDict([
+            ("ieot-version", UINT32.unpack_from(data)[0]),
+            ("blocks", list(struct.iter_unpack("! I I", data[4:]))),
+        ])
+    return None
+
+def read_extensions(f, pos):
+    "(signature, data) of each extension from f[pos] up to the checksum"
+    extensions = []
+    while pos < (len(f) - 20):
+        signature = f[pos:pos + 4].decode("ascii")
+        size = UINT32.unpack_from(f, pos + 4)[0]
+        extensions.append((signature, f[pos + 8:pos + 8 + size]))
+        pos += 8 + size
+    return extensions
+
+def find_entry_blocks(f):
+    "Blocks of entries listed by IEOT, if EOIE locates a valid one, else None"
+    # EOIE is always the last extension and always 24 bytes long
+    eoie = len(f) - 20 - (8 + 24)
+    if eoie < 12 or f[eoie:eoie + 8] != b"EOIE" + UINT32.pack(24):
+        return None
+    eoie_fields = decode_extension("EOIE", f[eoie + 8:eoie + 32])
+
+    # Walk the extension headers only, hashing them as EOIE describes
+    pos = eoie_fields["offset"]
+    headers = hashlib.sha1()
+    blocks = None
+    while pos < eoie:
+        signature = f[pos:pos + 4]
+        size = UINT32.unpack_from(f, pos + 4)[0]
+        headers.update(f[pos:pos + 8])
+        if signature == b"IEOT":
+            ieot = decode_extension("IEOT", f[pos + 8:pos + 8 + size])
+            if ieot["ieot-version"] == 1:
+                blocks = ieot["blocks"]
+        pos += 8 + size
+    if pos != eoie or headers.hexdigest() != eoie_fields["hash"]:
+        return None
+    return blocks
+
+def parse_block(filename, version, pos, count):
+    "decode_entries() over one block of the named file, for worker processes"
+    with open(filename, "rb") as o:
+        f = open_index(o)
+        columns, _ = decode_entries(f, version, pos, count)
+        f.close()
+    return columns
+
+def entry_block_executor(jobs):
+    "Threads where the GIL is disabled, since they can then run in parallel, else processes"
+    gil_enabled = getattr(sys, "_is_gil_enabled", lambda: True)()
+    if gil_enabled:
+        return concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+    return concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+
+def parse_columns(filename, jobs=1, verify=False):
+    """Parse an index file into an IndexColumns, decoding fixed fields in bulk
+
+    With jobs > 1 (None for one per CPU), the blocks of entries listed by
+    the EOIE/IEOT extensions are decoded in parallel. Indexes without them
+    are parsed sequentially; either way the result is the same. Each
+    block's columns are pickled back from its process and joined, which
+    costs about what decoding them in parallel saves on one CPU, so jobs
+    stays 1 unless several idle cores are known to be there. With
+    verify, the trailing checksum is checked against the file contents,
+    hashed as the entries are decoded.
+    """
+    with open(filename, "rb") as o:
+        f = open_index(o)
+
+        check(f[0:4] == b"DIRC", "Not a Git index file")
+        version, count = struct.unpack_from("! I I", f, 4)
+        check(version in {2, 3, 4}, "Unsupported version: %s" % version)
+
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+        blocks = find_entry_blocks(f) if jobs > 1 else None
+        hasher = StreamingHash(f) if verify else None
+
+        if blocks and len(blocks) > 1:
+            check(sum(block_count for _, block_count in blocks) == count,
+                "IEOT does not cover every entry")
+            with entry_block_executor(min(jobs, len(blocks))) as executor:
+                parts = executor.map(parse_block,
+                    itertools.repeat(filename), itertools.repeat(version),
+                    *zip(*blocks))
+                # Hash here while the workers decode
+                if hasher:
+                    hasher.advance(len(f) - 20)
+                columns = IndexColumns(version)
+                for part in parts:
+                    columns.extend(part)
+            pos = UINT32.unpack_from(f, len(f) - 20 - 24)[0]
+        else:
+            columns, pos = decode_entries(f, version, 12, count, hasher)
+
+        columns.extensions = read_extensions(f, pos)
+        columns.checksum = binascii.hexlify(f[len(f) - 20:]).decode("ascii")
+        if hasher:
+            verify_checksum(hasher, f)
+        f.close()
+
+    return columns
+
+IndexDiff = collections.namedtuple("IndexDiff", "added removed modified mode_changed")
+
+def entry_range(columns, prefix):
+    "Position of the first entry whose path starts with prefix (bytes)"
+    return bisect.bisect_left(range(len(columns)), prefix, key=columns.name_bytes)
+
+def identical_subtrees(old, new):
+    """(old start, new start, count) of the entry ranges the TREE extensions of
+    old and new show to be the same, in entry order
+
+    Directories with the same tree object id hold the same entries, so
+    the diff can step over them without comparing each one. Only the
+    outermost such directories are listed.
+    """
+    old_root, new_root = old.cache_tree(), new.cache_tree()
+    if old_root is None or new_root is None:
+        return []
+    ranges = []
+    pending = [(old_root, new_root, b"")]
+    while pending:
+        old_tree, new_tree, prefix = pending.pop()
+        if old_tree.valid() and new_tree.valid() and old_tree.sha1 == new_tree.sha1:
+            if old_tree.entry_count:
+                start = entry_range(old, prefix) if prefix else 0
+                new_start = entry_range(new, prefix) if prefix else 0
+                ranges.append((start, new_start, old_tree.entry_count))
+            continue
+        # An invalidated directory may still have valid subtrees
+        new_children = {child.name: child for child in new_tree.children}
+        for child in old_tree.children:
+            if child.name in new_children:
+                pending.append((child, new_children[child.name], prefix + child.name.encode("utf-8") + b"/"))
+    ranges.sort()
+    return ranges
+
+def diff_columns(old, new):
+    """Entries added, removed and modified between two IndexColumns
+
+    added holds positions in new, removed positions in old; modified and
+    mode_changed hold (old, new) position pairs of paths whose SHA-1 or
+    whose mode changed, respectively. Both indexes are sorted by path,
+    so one merge-join pass finds them all, stepping over directories
+    whose TREE extension entries show them unchanged.
+    """
+    added, removed, modified, mode_changed = [], [], [], []
+    old_count, new_count = len(old), len(new)
+    skips = identical_subtrees(old, new)
+    skips.append((old_count, new_count, 0))
+    skip = 0
+    i = j = 0
+    while i < old_count and j < new_count:
+        if i == skips[skip][0] and j == skips[skip][1]:
+            i += skips[skip][2]
+            j += skips[skip][2]
+            skip += 1
+            continue
+        old_name = old.name_bytes(i)
+        new_name = new.name_bytes(j)
+        if old_name == new_name:
+            if old.sha1[20 * i:20 * i + 20] != new.sha1[20 * j:20 * j + 20]:
+                modified.append((i, j))
+            if old.mode[i] != new.mode[j]:
+                mode_changed.append((i, j))
+            i += 1
+            j += 1
+        elif old_name < new_name:
+            removed.append(i)
+            i += 1
+        else:
+            added.append(j)
+            j += 1
+        # Past the start of an unchanged directory without meeting it in
+        # step, as when its entries differ in stage; compare it entry by entry
+        while i > skips[skip][0] or j > skips[skip][1]:
+            skip += 1
+    removed.extend(range(i, old_count))
+    added.extend(range(j, new_count))
+    return IndexDiff(added, removed, modified, mode_changed)
+
+IndexIdentity = collections.namedtuple("IndexIdentity", "checksum size mtime_ns ino")
+
+def index_identity(filename):
+    "Cheap fingerprint of an index file: its trailing checksum plus stat data"
+    st = os.stat(filename)
+    with open(filename, "rb") as o:
+        o.seek(-20, os.SEEK_END)
+        checksum = binascii.hexlify(o.read(20)).decode("ascii")
+    return IndexIdentity(checksum, st.st_size, st.st_mtime_ns, st.st_ino)
+
+def same_index(filename, identity):
+    "Whether filename still holds the index that identity was taken from"
+    if identity is None or not os.path.isfile(filename):
+        return False
+    st = os.stat(filename)
+    if (st.st_size, st.st_mtime_ns, st.st_ino) == identity[1:]:
+        return True
+    # Rewritten, but possibly with the same contents; a null checksum
+    # (index.skipHash) says nothing about them
+    return identity.checksum != NULL_SHA1 and index_identity(filename).checksum == identity.checksum
+
+def parse_file(arg, pretty=True, verify=False):
     if pretty:
        properties = {
            "version": "[header]",
@@ -161,32 +711,57 @@ def parse_file(arg, pretty=True):
            "checksum": "[checksum]"
        }
     else:
-        print("[")
-
-    for item in parse(arg, pretty=pretty):
-        if pretty:
-            for key, value in properties.items():
-                if key in item:
-                    print(value)
-                    break
-            else:
-                print("[?]")
+        write = sys.stdout.write
+        encode = json.JSONEncoder().encode
+        write("[\n")
 
-        if pretty:
-            for key, value in item.items():
-                print(" ", key, "=", value)
+    for item in parse(arg, pretty=pretty, verify=verify):
+        last = "checksum" in item
+        if not pretty:
+            # One write per item; print() costs a call per separator too
+            write(encode(item) + ("\n" if last else "\n,\n"))
+            continue
+
+        for key, value in properties.items():
+            if key in item:
+                print(value)
+                break
         else:
-            print(json.dumps(item))
+            print("[?]")
+
+        for key, value in item.items():
+            print(" ", key, "=", value)
 
-        last = "checksum" in item
         if not last:
-            if pretty:
-                print()
-            else:
-                print(",")
+            print()
 
     if not pretty:
-        print("]")
+        write("]\n")
+
+def diff_file(old_filename, new_filename, pretty=True):
+    "Print what changed from one index file to another, as lines or as JSON"
+    old, new = parse_columns(old_filename), parse_columns(new_filename)
+    diff = diff_columns(old, new)
+    changes = [("added", None, j) for j in diff.added]
+    changes += [("removed", i, None) for i in diff.removed]
+    changes += [("modified", i, j) for i, j in diff.modified]
+    changes += [("mode", i, j) for i, j in diff.mode_changed]
+    # In path order, as git lists them
+    changes.sort(key=lambda change: new.name_bytes(change[2]) if change[1] is None else old.name_bytes(change[1]))
+    for status, i, j in changes:
+        name = new.name(j) if i is None else old.name(i)
+        item = collections.OrderedDict([("status", status), ("name", name)])
+        if i is not None and j is not None:
+            if status == "modified":
+                item["sha1"] = [old.sha1_hex(i), new.sha1_hex(j)]
+            else:
+                item["mode"] = ["%06o" % old.mode[i], "%06o" % new.mode[j]]
+        if not pretty:
+            print(json.dumps(item))
+        elif status == "mode":
+            print("%-9s %s (%s -> %s)" % (status, name, *item["mode"]))
+        else:
+            print("%-9s %s" % (status, name))
 
 def main():
     import argparse
@@ -196,8 +771,34 @@ def main():
     parser = argparse.ArgumentParser(description="parse a Git index file")
     parser.add_argument("-j", "--json", action="store_true",
         help="output JSON")
+    parser.add_argument("-c", "--verify", action="store_true",
+        help="check the trailing checksum against the file contents")
     parser.add_argument("-v", "--version", action="store_true",
         help="show script version number")
+    parser.add_argument("-e", "--export", choices=("ndjson", "csv", "npz"),
+        help="write the entries in this format, built from the parsed columns")
+    parser.add_argument("--fields",
+        help="comma-separated entry fields to export (default: all)")
+    parser.add_argument("-o", "--output",
+        help="file to export to (default: stdout)")
+    parser.add_argument("-d", "--diff", metavar="OLD",
+        help="list the paths added, removed, modified or changed in mode since the index at OLD")
+    parser.add_argument("-f", "--find", metavar="PATTERN",
+        help="only list the paths containing PATTERN, or matching it if it is a glob with *?[")
+    parser.add_argument("--prefix",
+        help="only list the paths starting with PREFIX")
+    parser.add_argument("--mode",
+        help="only list entries with this mode: octal, or file, executable, symlink or gitlink")
+    parser.add_argument("--size", metavar="MIN:MAX",
+        help="only list entries of MIN to MAX bytes; either may be left out")
+    parser.add_argument("--mtime", metavar="MIN:MAX",
+        help="only list entries modified MIN to MAX seconds since the epoch")
+    parser.add_argument("--stage", type=int, choices=range(4),
+        help="only list entries at this merge stage")
+    parser.add_argument("--skip-worktree", action="store_true", default=None,
+        help="only list skip-worktree entries")
+    parser.add_argument("--intent-to-add", action="store_true", default=None,
+        help="only list intent-to-add entries")
     parser.add_argument("path", nargs="?", default=".",
         help="path to a Git repository or index file")
     args = parser.parse_args()
@@ -206,20 +807,52 @@ def main():
         print("gin " + version)
         sys.exit()
 
-    if os.path.isdir(args.path):
-        path = os.path.join(args.path, ".git", "index")
-        if os.path.isfile(path):
-            args.path = path
-        else:
+    def index_path(path):
+        if not os.path.isdir(path):
+            return path
+        path = os.path.join(path, ".git", "index")
+        if not os.path.isfile(path):
             print("error: couldn't find a .git/index file to use", file=sys.stderr)
             print("use -h or --help for some documentation", file=sys.stderr)
             sys.exit(1)
+        return path
+
+    args.path = index_path(args.path)
 
     if not args.path:
         parser.print_usage()
         sys.exit(2)
 
-    parse_file(args.path, pretty=not args.json)
+    if args.diff:
+        diff_file(index_path(args.diff), args.path, pretty=not args.json)
+        return
+
+    if args.export:
+        import export
+        try:
+            fields = export.parse_fields(args.fields)
+        except ValueError as e:
+            parser.error(str(e))
+        export.export_file(args.path, args.output, args.export, fields)
+        return
+
+    filters = {"mode": args.mode, "size": args.size, "mtime": args.mtime, "stage": args.stage,
+        "skip_worktree": args.skip_worktree, "intent_to_add": args.intent_to_add}
+    if args.find or args.prefix or any(value is not None for value in filters.values()):
+        # Searching needs numpy, which parsing alone does not
+        import search
+        try:
+            if filters["mode"] is not None:
+                filters["mode"] = search.parse_mode(filters["mode"])
+            for name in ("size", "mtime"):
+                if filters[name] is not None:
+                    filters[name] = search.parse_range(filters[name])
+        except ValueError as e:
+            parser.error(str(e))
+        search.search_file(args.path, args.find, args.prefix, pretty=not args.json, **filters)
+        return
+
+    parse_file(args.path, pretty=not args.json, verify=args.verify)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
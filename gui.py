@@ -1,20 +1,43 @@
 import sys
 import os
-import git
 import shutil
 import hashlib
 import time
+import queue
+import itertools
+import concurrent.futures
+import pathlib
+import tempfile
+import webbrowser
 import customtkinter as ctk
-import networkx as nx
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.figure import Figure
 import gin
-import matplotlib.pyplot as plt
-from main import build_tree_from_index, visualize_tree, draw_tree
+from artifacts import ArtifactCache
+from layout import choose_layout
+from profiling import StageTimer
+from core import (NODE_BUDGET, build_graph, build_compact_tree, changed_nodes, format_size,
+                  iter_tree_lines, mark_status, node_for_path, repo_name_from_url)
+from render import WEB_NODE_BUDGET, layout_graph, draw_tree, render_html
+
+# Fetch, parse, build tree, lay out, draw
+PIPELINE_STAGES = 5
+# Lines of the text tree in the textbox at a time
+TEXT_PAGE_LINES = 200
+# Shown when gin.check() exits on an index it cannot read; its own
+# message goes to stderr
+INVALID_INDEX = "invalid or unsupported index file (details on stderr)"
+
+class PipelineCancelled(Exception):
+    """Raised inside the background pipeline when its request was superseded"""
 
 class GitIndexVisualizer(ctk.CTk):
-    def __init__(self):
+    def __init__(self, profile=False):
         super().__init__()
 
+        # Print the time each pipeline stage takes, to stderr
+        self.profile = profile
+
         self.title("Git Index Visualizer")
         self.geometry("1000x600")
 
@@ -26,6 +49,29 @@ class GitIndexVisualizer(ctk.CTk):
         # Cache settings
         self.cache_ttl = 24 * 60 * 60  # 24 hours in seconds
         self.cache_size_limit = 5  # Maximum number of cached repositories
+        # Fetch only the latest commit's trees rather than the full history
+        # when the "Shallow fetch" box is ticked; file sizes are then unknown
+        self.shallow_clone = False
+
+        # Parsed entries, trees and layouts derived from the cached clones
+        self.artifacts = ArtifactCache(os.path.join(self.cache_dir, "artifacts"),
+                                       size_limit=512 * 1024 * 1024)
+
+        # Fingerprint of the index currently shown, to skip redrawing it
+        self.shown_repo_url = None
+        self.shown_index = None
+        self.shown_tree = None
+        self.shown_graph = None
+        # Paths of the directories the user expanded beyond the node budget
+        self.expanded = set()
+        self.shown_pos = None
+        # Nodes the last refresh of the shown repository changed
+        self.changed = set()
+        # {path: status name} of the dirty files in the shown local repository
+        self.dirty = {}
+        # Search index of the shown index's entries, and the marker of its matches
+        self.search_index = None
+        self.highlight = None
 
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
 
@@ -53,13 +99,51 @@ class GitIndexVisualizer(ctk.CTk):
                                                command=self.clear_cache)
         self.clear_cache_button.pack(side="left", padx=5)
 
+        # Colours the files of a local repository that differ from its index
+        self.status_button = ctk.CTkButton(button_frame, text="Status", command=self.check_status)
+        self.status_button.pack(side="left", padx=5)
+
+        # Much faster for large remotes, but the index it leaves has no sizes
+        self.shallow_checkbox = ctk.CTkCheckBox(self.sidebar_frame, text="Shallow fetch (no file sizes)")
+        self.shallow_checkbox.pack(pady=2)
+
+        # The shown index as an interactive WebGL page with far more nodes
+        self.browser_button = ctk.CTkButton(button_frame, text="Browser", command=self.open_in_browser)
+        self.browser_button.pack(side="left", padx=5)
+
+        # Path search over the shown index: a substring, or a glob with *?[
+        search_frame = ctk.CTkFrame(self.sidebar_frame)
+        search_frame.pack(pady=5)
+        self.search_entry = ctk.CTkEntry(search_frame, width=sidebar_width - 100,
+                                         placeholder_text="Find paths, e.g. *.py")
+        self.search_entry.pack(side="left", padx=5)
+        self.search_button = ctk.CTkButton(search_frame, text="Find", width=60, command=self.find)
+        self.search_button.pack(side="left", padx=5)
+
         self.textbox = ctk.CTkTextbox(self.sidebar_frame, width=sidebar_width - 20, height=200)
         self.textbox.pack(pady=10, fill="both", expand=True)
 
+        # The text tree is shown a page at a time, its lines generated as
+        # the pages are reached
+        page_frame = ctk.CTkFrame(self.sidebar_frame)
+        page_frame.pack(pady=5)
+        self.previous_page_button = ctk.CTkButton(page_frame, text="◀", width=40,
+                                                  command=lambda: self.show_page(self.text_page - 1))
+        self.previous_page_button.pack(side="left", padx=5)
+        self.page_label = ctk.CTkLabel(page_frame, text="")
+        self.page_label.pack(side="left", padx=5)
+        self.next_page_button = ctk.CTkButton(page_frame, text="▶", width=40,
+                                              command=lambda: self.show_page(self.text_page + 1))
+        self.next_page_button.pack(side="left", padx=5)
+        self.tree_lines = []
+        self.tree_line_source = None
+        self.text_page = 0
+
         self.figure_frame = ctk.CTkFrame(self)
         self.figure_frame.pack(side="right", fill="both", expand=True)
 
-        self.figure = plt.figure(figsize=(7, 5))
+        # Not pyplot's, which would start a backend of its own
+        self.figure = Figure(figsize=(7, 5))
         self.ax = self.figure.add_subplot(111, projection='3d')  # Create a 3D subplot
         self.ax.set_axis_off()
         self.ax.grid(False)
@@ -69,6 +153,17 @@ class GitIndexVisualizer(ctk.CTk):
 
         # Connect the scroll event to the zoom function
         self.canvas.mpl_connect('scroll_event', self.zoom)
+        self.canvas.mpl_connect('pick_event', self.on_pick)
+
+        # Clone, parse and layout run on one background thread; results
+        # come back through a queue that the Tk thread polls
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.updates = queue.Queue()
+        self.request = 0  # Id of the latest visualization request
+        self.future = None
+        # Node, edge and label counts and seconds of the last drawing
+        self.render_stats = {}
+        self.after(50, self.process_updates)
 
         # Manage cache on startup
         self.manage_cache()
@@ -112,6 +207,8 @@ class GitIndexVisualizer(ctk.CTk):
         cache_entries = []
         for entry in os.listdir(self.cache_dir):
             entry_path = os.path.join(self.cache_dir, entry)
+            if entry_path == self.artifacts.directory:
+                continue
             if os.path.isdir(entry_path):
                 # Get the last modified time of the directory
                 mod_time = os.path.getmtime(entry_path)
@@ -120,12 +217,8 @@ class GitIndexVisualizer(ctk.CTk):
         # Sort entries by modification time (oldest first)
         cache_entries.sort(key=lambda x: x[1])
         
-        # Remove old entries beyond the TTL
-        current_time = time.time()
-        for entry_path, mod_time in cache_entries:
-            if current_time - mod_time > self.cache_ttl:
-                shutil.rmtree(entry_path, ignore_errors=True)
-                cache_entries.remove((entry_path, mod_time))
+        # Entries beyond the TTL are kept: visualize_repo refreshes them
+        # in place, which costs far less than cloning them again
         
         # Ensure we're within the cache size limit
         while len(cache_entries) > self.cache_size_limit:
@@ -133,114 +226,518 @@ class GitIndexVisualizer(ctk.CTk):
             oldest_entry = cache_entries.pop(0)
             shutil.rmtree(oldest_entry[0], ignore_errors=True)
 
+        self.artifacts.evict()
+
     def clear_cache(self):
         """Clear all cached repositories"""
+        # Stop any pipeline still working in the cache
+        self.request += 1
         for entry in os.listdir(self.cache_dir):
             entry_path = os.path.join(self.cache_dir, entry)
             if os.path.isdir(entry_path):
                 shutil.rmtree(entry_path)
         
         self.cache_status.configure(text="Cache cleared")
-        self.textbox.delete("1.0", ctk.END)
-        self.textbox.insert(ctk.END, "Cache has been cleared successfully.")
+        self.show_text("Cache has been cleared successfully.")
 
     def visualize_repo(self):
         repo_url = self.entry.get()
         
-        # Normalize the URL (remove .git suffix if present)
-        if repo_url.endswith(".git"):
-            repo_url = repo_url[:-4]
-        
-        # Fix GitHub URL format
-        if "/tree/master" in repo_url:
-            repo_url = repo_url.split("/tree/master")[0]
-            
-        # Ensure we have .git at the end for proper cloning
-        if not repo_url.endswith(".git"):
-            repo_url = repo_url + ".git"
+        # Local repositories are cloned from as they are
+        if not os.path.isdir(repo_url):
+            # Normalize the URL (remove .git suffix if present)
+            if repo_url.endswith(".git"):
+                repo_url = repo_url[:-4]
+
+            # Fix GitHub URL format
+            if "/tree/master" in repo_url:
+                repo_url = repo_url.split("/tree/master")[0]
+
+            # Ensure we have .git at the end for proper cloning
+            if not repo_url.endswith(".git"):
+                repo_url = repo_url + ".git"
             
         self.entry.delete(0, ctk.END)
         self.entry.insert(0, repo_url)
-            
+        self.shallow_clone = bool(self.shallow_checkbox.get())
+        if repo_url != self.shown_repo_url:
+            self.expanded = set()
+
+        # Supersede whatever is still running; a request that has not
+        # started yet is dropped outright, a running one stops at its next
+        # stage boundary
+        self.request += 1
+        if self.future is not None:
+            self.future.cancel()
+        self.future = self.executor.submit(self.run_pipeline, self.request, repo_url, self.shallow_clone)
+
+    def post(self, request, function, *args):
+        """Run function(*args) on the Tk thread, unless request is superseded by then"""
+        self.updates.put((request, function, args))
+
+    def process_updates(self):
+        """Apply what the background pipeline posted; Tk is only touched from here
+
+        An update that fails is reported and the rest still applied; polling
+        goes on whatever happens.
+        """
+        try:
+            while True:
+                request, function, args = self.updates.get_nowait()
+                if request != self.request:
+                    continue
+                try:
+                    function(*args)
+                except Exception as e:
+                    self.show_error(e)
+        except queue.Empty:
+            pass
+        finally:
+            self.after(50, self.process_updates)
+
+    def checkpoint(self, request):
+        """Stop the pipeline for request if a newer one was submitted"""
+        if request != self.request:
+            raise PipelineCancelled()
+
+    def report(self, request, stage, text):
+        """Show the progress of request's pipeline in the status label"""
+        self.checkpoint(request)
+        self.post(request, lambda: self.cache_status.configure(
+            text=f"[{stage}/{PIPELINE_STAGES}] {text}"))
+
+    def show_text(self, text):
+        self.tree_lines = []
+        self.tree_line_source = None
+        self.page_label.configure(text="")
+        self.textbox.delete("1.0", ctk.END)
+        self.textbox.insert(ctk.END, text)
+
+    def show_tree(self, tree):
+        """Show the text tree of tree from its first page"""
+        self.tree_lines = []
+        self.tree_line_source = iter_tree_lines(tree)
+        self.show_page(0)
+
+    def show_page(self, page):
+        """Put page of the text tree in the textbox, generating lines up to it"""
+        if self.tree_line_source is not None:
+            # One line past the page tells whether there is another
+            wanted = (page + 1) * TEXT_PAGE_LINES + 1
+            self.tree_lines.extend(line for _, line in
+                                   itertools.islice(self.tree_line_source, wanted - len(self.tree_lines)))
+            if len(self.tree_lines) < wanted:
+                self.tree_line_source = None
+        last_page = max(len(self.tree_lines) - 1, 0) // TEXT_PAGE_LINES
+        if self.tree_line_source is None:
+            page = min(page, last_page)
+        page = max(page, 0)
+        self.text_page = page
+        start = page * TEXT_PAGE_LINES
+        window = self.tree_lines[start:start + TEXT_PAGE_LINES]
+        self.textbox.delete("1.0", ctk.END)
+        self.textbox.insert(ctk.END, "\n".join(window))
+        total = "" if self.tree_line_source is not None else f" of {len(self.tree_lines)}"
+        self.page_label.configure(text=f"Lines {start + 1}-{start + len(window)}{total}")
+
+    def show_error(self, error):
+        self.show_text(f"Error: {str(error)}")
+        self.cache_status.configure(text="Error occurred")
+
+    def run_pipeline(self, request, repo_url, shallow=False):
+        """Clone, parse, build and lay out repo_url in the background"""
+        timer = StageTimer()
+        try:
+            with timer.stage("fetch"):
+                repo_dir, previous_checksum = self.fetch_repo(request, repo_url, shallow)
+
+            # Proceed with visualization using the cached repository
+            index_file = os.path.join(repo_dir, ".git", "index")
+
+            if not os.path.isfile(index_file):
+                self.post(request, self.show_text, f"Error: Index file not found at {index_file}")
+                return
+
+            if repo_url == self.shown_repo_url and gin.same_index(index_file, self.shown_index):
+                self.post(request, lambda: self.cache_status.configure(text="Index unchanged"))
+                return
+
+            self.report(request, 2, "Parsing index...")
+            index_identity = gin.index_identity(index_file)
+            checksum = index_identity.checksum
+
+            # Everything derived from the index is cached by its checksum
+            with timer.stage("cache"):
+                tree = self.artifacts.load_tree(checksum)
+            # Nodes whose positions a refresh invalidated, if the previous
+            # index is at hand to compare with
+            affected = None
+            if tree is None:
+                with timer.stage("parse"):
+                    entries = self.artifacts.load_columns(checksum)
+                    if entries is None:
+                        entries = gin.parse_columns(index_file)
+                        self.artifacts.store_columns(entries)
+                self.report(request, 3, "Building tree...")
+                # A refresh parses the whole new index and rebuilds the tree
+                # from it; the diff only decides which nodes lose their
+                # previous layout positions and are marked as changed
+                if previous_checksum and previous_checksum != entries.checksum:
+                    previous_entries = self.artifacts.load_columns(previous_checksum)
+                    if previous_entries is not None:
+                        with timer.stage("diff"):
+                            diff = gin.diff_columns(previous_entries, entries)
+                            affected = changed_nodes(previous_entries, entries, diff)
+                with timer.stage("tree"):
+                    tree = build_compact_tree(entries, repo_url)
+                    self.artifacts.store_tree(entries.checksum, tree)
+            # The same index may have been cached under another URL
+            tree.name = repo_name_from_url(repo_url)
+
+            # The text tree can be shown while the layout is computed
+            self.checkpoint(request)
+            if tree.children:
+                self.post(request, self.show_tree, tree)
+            else:
+                self.post(request, self.show_text, "No files found.")
+
+            self.lay_out(request, repo_url, index_identity, tree, affected, previous_checksum, timer)
+
+        except PipelineCancelled:
+            pass
+        except Exception as e:
+            self.post(request, self.show_error, e)
+        except SystemExit:
+            # Raised by gin.check() in the worker thread, where it would otherwise vanish
+            self.post(request, self.show_error, INVALID_INDEX)
+
+    def lay_out(self, request, repo_url, index_identity, tree, affected=None, previous_checksum=None,
+                timer=None):
+        """Build the graph of tree within the node budget, lay it out and post it for drawing
+
+        timer, a StageTimer, collects the stage times of the whole pipeline
+        for --profile; a new one is started if not given.
+        """
+        if timer is None:
+            timer = StageTimer()
+        checksum = index_identity.checksum
+        self.report(request, 4, "Laying out graph...")
+        expanded = self.expanded
+        with timer.stage("graph"):
+            graph = build_graph(tree, NODE_BUDGET, expanded)
+
+        computed = self.cached_layout(checksum, tree, graph, NODE_BUDGET, expanded, affected,
+                                      previous_checksum, timer)
+
+        self.report(request, 5, "Drawing...")
+        self.post(request, self.show_graph, repo_url, index_identity, tree, graph, computed, affected, timer)
+
+    def cached_layout(self, checksum, tree, graph, budget, expanded, affected=None, previous_checksum=None,
+                      timer=None):
+        """3D positions of graph, from the artifact cache if laid out before
+
+        A fresh layout is stored there for next time. With affected, the
+        nodes a refresh did not touch keep their previous positions.
+        """
+        algorithm = choose_layout(graph)
+        layout_params = {"layout": algorithm, "dim": 3, "root": tree.name,
+                         "budget": budget, "expanded": sorted(expanded)}
+        pos = self.artifacts.load_layout(checksum, layout_params)
+        if pos is not None and (len(pos) != graph.number_of_nodes() or any(node not in graph for node in pos)):
+            # Stored for another graph, such as one keyed by name
+            pos = None
+        if pos is None and affected is not None:
+            # Keep the unaffected part of the previous layout in place
+            previous_pos = self.artifacts.load_layout(previous_checksum, layout_params)
+            if previous_pos is not None:
+                pos = {node: xyz for node, xyz in previous_pos.items()
+                       if node not in affected and node in graph}
+        with (timer or StageTimer()).stage("layout"):
+            computed = layout_graph(graph, is_3d=True, pos=pos, algorithm=algorithm)
+            if pos is None or len(pos) != len(computed):
+                self.artifacts.store_layout(checksum, layout_params, computed)
+        return computed
+
+    def expand(self, request):
+        """Lay out the shown tree again with node expanded, in the background"""
+        try:
+            self.lay_out(request, self.shown_repo_url, self.shown_index, self.shown_tree)
+        except PipelineCancelled:
+            pass
+        except Exception as e:
+            self.post(request, self.show_error, e)
+
+    def on_pick(self, event):
+        """Expand the collapsed node that was clicked"""
+        if self.shown_graph is None or not len(event.ind):
+            return
+        node = list(self.shown_graph.nodes())[event.ind[0]]
+        attributes = self.shown_graph.nodes[node]
+        if not attributes.get("collapsed"):
+            return
+        # The summary of a directory's smaller children expands the directory
+        # A new set, as the background thread may be reading the old one
+        self.expanded = self.expanded | {attributes.get("parent", node)}
+        self.request += 1
+        if self.future is not None:
+            self.future.cancel()
+        self.future = self.executor.submit(self.expand, self.request)
+
+    def fetch_repo(self, request, repo_url, shallow=False):
+        """Clone or refresh repo_url in the cache, shallow or in full
+
+        A cached clone made the other way is cloned again. Returns the
+        clone's directory and, if it was refreshed, the checksum its index
+        had before.
+        """
+        # gitpython is only loaded once something needs fetching
+        import git
+        from fetch import clone_for_index, clone_url, refresh_for_index
+
         cache_path = self.get_cache_path(repo_url)
         using_cache = False
+        refresh = False
         
         if os.path.exists(cache_path):
+            using_cache = True
             # Check if the cache is still valid
             mod_time = os.path.getmtime(cache_path)
             if time.time() - mod_time <= self.cache_ttl:
-                using_cache = True
-                # Update the access time to mark it as recently used
-                os.utime(cache_path, None)
-                self.cache_status.configure(text="Using cached repository")
+                self.report(request, 1, "Using cached repository")
             else:
-                # Cache is too old, remove it
-                shutil.rmtree(cache_path, ignore_errors=True)
-                self.cache_status.configure(text="Cache expired, refreshing...")
+                # Cache is too old, fetch what changed into it
+                refresh = True
+                self.report(request, 1, "Cache expired, refreshing...")
+            # Update the access time to mark it as recently used
+            os.utime(cache_path, None)
         else:
-            self.cache_status.configure(text="Cloning repository...")
+            self.report(request, 1, "Cloning repository...")
         
-        try:
-            if using_cache:
-                repo_dir = cache_path
-                # Check if the local repository is still valid
-                try:
-                    repo = git.Repo(repo_dir)
-                    # Verify this is the right repository
-                    if repo_url != repo.remotes.origin.url:
-                        using_cache = False
-                        shutil.rmtree(cache_path)
-                        self.cache_status.configure(text="Cache mismatch, recloning...")
-                except git.exc.InvalidGitRepositoryError:
+        # Checksum of the index before a refresh, to update its artifacts
+        previous_checksum = None
+
+        if using_cache:
+            # Check if the local repository is still valid
+            try:
+                repo = git.Repo(cache_path)
+                # Verify this is the right repository
+                if clone_url(repo_url) != repo.remotes.origin.url:
                     using_cache = False
                     shutil.rmtree(cache_path)
-                    self.cache_status.configure(text="Invalid cache, recloning...")
-            
-            if not using_cache:
-                # Clone the repository to the cache
-                repo = git.Repo.clone_from(repo_url, cache_path)
-                self.cache_status.configure(text="Repository cached")
-                repo_dir = cache_path
-                
-                # Update cache management
-                self.manage_cache()
-            
-            # Proceed with visualization using the cached repository
-            index_file = os.path.join(repo_dir, ".git", "index")
-
-            if not os.path.isfile(index_file):
-                self.textbox.delete("1.0", ctk.END)
-                self.textbox.insert(ctk.END, f"Error: Index file not found at {index_file}")
-                return
+                    self.report(request, 1, "Cache mismatch, recloning...")
+                elif shallow != os.path.isfile(os.path.join(repo.git_dir, "shallow")):
+                    using_cache = False
+                    shutil.rmtree(cache_path)
+                    self.report(request, 1, "Fetch mode changed, recloning...")
+            except git.exc.InvalidGitRepositoryError:
+                using_cache = False
+                shutil.rmtree(cache_path)
+                self.report(request, 1, "Invalid cache, recloning...")
+
+        if using_cache and refresh:
+            index_file = os.path.join(cache_path, ".git", "index")
+            if os.path.isfile(index_file):
+                previous_checksum = gin.index_identity(index_file).checksum
+            try:
+                stats = refresh_for_index(repo)
+                self.report(request, 1, "Repository refreshed in %.1f s, %s received" %
+                            (stats["seconds"], format_size(stats["bytes"])))
+            except git.exc.GitCommandError:
+                using_cache = False
+                previous_checksum = None
+                shutil.rmtree(cache_path, ignore_errors=True)
+                self.report(request, 1, "Refresh failed, recloning...")
+
+        if not using_cache:
+            # Clone the repository to the cache
+            repo, stats = clone_for_index(repo_url, cache_path, shallow=shallow)
+            self.report(request, 1, "Repository cached in %.1f s, %s received" %
+                        (stats["seconds"], format_size(stats["bytes"])))
+
+            # Update cache management
+            self.manage_cache()
+
+        return cache_path, previous_checksum
+
+    def show_graph(self, repo_url, index_identity, tree, graph, pos, changed=None, timer=None):
+        """Draw a laid out graph; the last stage, run on the Tk thread
+
+        changed names the nodes a refresh changed, which are marked; when
+        redrawing the same index without it, the marks from before stay.
+        timer holds the times of the stages before, reported with --profile.
+        """
+        if changed is not None or index_identity != self.shown_index:
+            self.changed = changed or set()
+        if repo_url != self.shown_repo_url:
+            self.dirty = {}
+        if timer is None:
+            timer = StageTimer()
+        mark_status(graph, self.dirty)
+        self.ax.clear()
+        stats = {}
+        with timer.stage("draw"):
+            draw_tree(graph, self.ax, is_3d=True, pos=pos, stats=stats)  # Pass a flag to indicate 3D drawing
+            points = [pos[node] for node in self.changed if node in pos]
+            if points:
+                xs, ys, zs = zip(*points)
+                self.ax.scatter(xs, ys, zs, s=150, c='orange', depthshade=False)
+        start = time.perf_counter()
+        with timer.stage("canvas"):
+            self.canvas.draw()
+        stats["canvas_seconds"] = time.perf_counter() - start
+        self.render_stats = stats
+        self.shown_repo_url = repo_url
+        self.shown_index = index_identity
+        self.shown_tree = tree
+        self.shown_graph = graph
+        self.shown_pos = pos
+        self.highlight = None
+        status = "Drew %d nodes in %.2f s" % (stats["nodes"], stats["seconds"] + stats["canvas_seconds"])
+        if points:
+            status += ", %d changed" % len(points)
+        self.cache_status.configure(text=status)
+        if self.profile:
+            timer.report("gui.py stages")
+
+    def open_in_browser(self):
+        """Write the shown index as a WebGL page and open it, in the background"""
+        if self.shown_tree is None:
+            self.cache_status.configure(text="Nothing to show yet")
+            return
+        self.executor.submit(self.run_browser, self.request, self.shown_index, self.shown_tree)
+
+    def run_browser(self, request, index_identity, tree):
+        """Lay out tree within WEB_NODE_BUDGET, reusing cached positions, and render it to HTML"""
+        try:
+            self.post(request, lambda: self.cache_status.configure(text="Writing page..."))
+            start = time.perf_counter()
+            timer = StageTimer()
+            expanded = self.expanded
+            with timer.stage("graph"):
+                graph = build_graph(tree, WEB_NODE_BUDGET, expanded)
+            self.checkpoint(request)
+            pos = self.cached_layout(index_identity.checksum, tree, graph, WEB_NODE_BUDGET, expanded, timer=timer)
+            self.checkpoint(request)
+            mark_status(graph, self.dirty)
+            # One page per index, overwritten when it is opened again
+            filename = os.path.join(tempfile.gettempdir(), f"git-index-{index_identity.checksum[:12]}.html")
+            with timer.stage("html"):
+                render_html(graph, filename, is_3d=True, pos=pos, title=tree.name)
+            webbrowser.open(pathlib.Path(filename).as_uri())
+            if self.profile:
+                timer.report("gui.py browser stages")
+            text = "Opened %d nodes in the browser (%.2f s)" % (len(graph), time.perf_counter() - start)
+            self.post(request, lambda: self.cache_status.configure(text=text))
+        except PipelineCancelled:
+            pass
+        except Exception as e:
+            self.post(request, self.show_error, e)
 
-            entries = list(gin.parse(index_file))
-            tree = build_tree_from_index(entries, repo_url)
-            tree_str = str(tree)
-            # print(tree_str)
+    def check_status(self):
+        """Compare a local repository's worktree with its index, in the background"""
+        if self.shown_repo_url is None or not os.path.isdir(self.shown_repo_url):
+            self.cache_status.configure(text="Status needs a local repository")
+            return
+        self.executor.submit(self.run_status, self.request, self.shown_repo_url)
 
-            graph = nx.DiGraph()
-            visualize_tree(tree, graph)
+    def run_status(self, request, repo_dir):
+        """Find the dirty files of repo_dir and redraw the graph with them coloured"""
+        from status import dirty_paths, worktree_status
 
-            self.ax.clear()
-            draw_tree(graph, self.ax, is_3d=True)  # Pass a flag to indicate 3D drawing
-            self.canvas.draw()
+        try:
+            self.post(request, lambda: self.cache_status.configure(text="Checking worktree..."))
+            index_file = os.path.join(repo_dir, ".git", "index")
+            start = time.perf_counter()
+            columns = gin.parse_columns(index_file)
+            dirty = dirty_paths(columns, worktree_status(repo_dir, columns, index_file))
+            self.post(request, self.show_status, dirty, len(columns), time.perf_counter() - start)
+        except Exception as e:
+            self.post(request, self.show_error, e)
+        except SystemExit:
+            # Raised by gin.check() in the worker thread, where it would otherwise vanish
+            self.post(request, self.show_error, INVALID_INDEX)
+
+    def show_status(self, dirty, count, seconds):
+        self.dirty = dirty
+        self.show_graph(self.shown_repo_url, self.shown_index, self.shown_tree, self.shown_graph, self.shown_pos)
+        lines = [f"{status:9} {path}" for path, status in sorted(dirty.items())]
+        self.show_text(f"{len(dirty)} of {count} files differ from the index ({seconds:.2f} s)\n"
+                       + "\n".join(lines[:TEXT_PAGE_LINES]))
+
+    def find(self):
+        """Search the shown index for the query in the search box, in the background"""
+        query = self.search_entry.get().strip()
+        if not query:
+            return
+        # Runs after whatever is in progress, and is dropped if superseded
+        self.executor.submit(self.run_search, self.request, query)
+
+    def run_search(self, request, query):
+        """Find the paths matching query and the graph nodes showing them"""
+        from search import IndexSearch
 
-            # Search for files in the repository and display them
-            if tree_str:
-                self.textbox.delete("1.0", ctk.END)
-                self.textbox.insert(ctk.END, tree_str)
-            else:
-                self.textbox.insert(ctk.END, "No files found.")
-                
+        try:
+            identity = self.shown_index
+            if identity is None:
+                self.post(request, self.show_text, "Nothing to search yet.")
+                return
+            if self.search_index is None or self.search_index.columns.checksum != identity.checksum:
+                self.post(request, lambda: self.cache_status.configure(text="Indexing paths..."))
+                columns = self.artifacts.load_columns(identity.checksum)
+                if columns is None:
+                    index_file = os.path.join(self.get_cache_path(self.shown_repo_url), ".git", "index")
+                    columns = gin.parse_columns(index_file)
+                    self.artifacts.store_columns(columns)
+                self.search_index = IndexSearch(columns)
+                # Built here rather than in the first query, to time queries alone
+                self.search_index.build_trigrams()
+            start = time.perf_counter()
+            found = self.search_index.search(query)
+            seconds = time.perf_counter() - start
+
+            columns = self.search_index.columns
+            graph = self.shown_graph
+            paths = [columns.name(int(n)) for n in found[:TEXT_PAGE_LINES]]
+            nodes = {node_for_path(graph, columns.name(int(n))) for n in found} - {None}
+            self.post(request, self.show_matches, query, len(found), paths, nodes, seconds)
         except Exception as e:
-            self.textbox.delete("1.0", ctk.END)
-            self.textbox.insert(ctk.END, f"Error: {str(e)}")
-            self.cache_status.configure(text="Error occurred")
+            self.post(request, self.show_error, e)
+        except SystemExit:
+            # Raised by gin.check() in the worker thread, where it would otherwise vanish
+            self.post(request, self.show_error, INVALID_INDEX)
+
+    def show_matches(self, query, count, paths, nodes, seconds):
+        """List the first matches, mark their nodes and zoom to them"""
+        text = f"{count} paths match {query!r} ({seconds * 1000:.1f} ms)\n" + "\n".join(paths)
+        if count > len(paths):
+            text += f"\n... and {count - len(paths)} more"
+        self.show_text(text)
+        if self.highlight is not None:
+            self.highlight.remove()
+            self.highlight = None
+        points = [self.shown_pos[node] for node in nodes if node in self.shown_pos]
+        if points:
+            xs, ys, zs = zip(*points)
+            self.highlight = self.ax.scatter(xs, ys, zs, s=150, c='red', depthshade=False)
+            # Fit the view to the matches, with some room around them
+            for axis, values in (("x", xs), ("y", ys), ("z", zs)):
+                margin = max((max(values) - min(values)) * 0.1, 0.1)
+                getattr(self.ax, f"set_{axis}lim3d")(min(values) - margin, max(values) + margin)
+            self.canvas.draw_idle()
+        self.cache_status.configure(text=f"{count} matches, {len(points)} nodes marked")
 
     def on_closing(self):
+        self.request += 1
+        self.executor.shutdown(wait=False, cancel_futures=True)
         self.destroy()
         sys.exit()
 
 if __name__ == "__main__":
-    app = GitIndexVisualizer()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Git Index Visualizer")
+    parser.add_argument("--profile", action="store_true",
+                        help="print the time each stage of the pipeline takes, to stderr")
+    args = parser.parse_args()
+    app = GitIndexVisualizer(profile=args.profile)
     app.mainloop()
\ No newline at end of file
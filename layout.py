@@ -0,0 +1,254 @@
+"layout - node positions for the file tree graph"
+
+# The graph built by core.build_graph is a tree rooted at its first
+# node, which lets most layouts here run in linear time instead of the
+# quadratic force-directed iterations of networkx's spring_layout.
+#
+# Every layout takes the graph and the number of dimensions (2 or 3) and
+# returns {node: numpy array of coordinates}, like networkx's layouts.
+
+import math
+
+import numpy as np
+
+# Graphs up to this many nodes get spring_layout when no layout is chosen
+SPRING_LIMIT = 200
+
+def spanning_tree(graph):
+    """Nodes in breadth-first order from the root, with parent positions and depths
+
+    core.build_graph keys nodes by path, so its graphs are trees; in other
+    graphs a node keeps only the first parent it is reached from.
+    """
+    nodes = list(graph.nodes())
+    if not nodes:
+        return [], np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    root = nodes[0]
+    order = [root]
+    position = {root: 0}
+    parents = [-1]
+    depths = [0]
+    for index in range(len(graph)):
+        if index == len(order):
+            # Not reachable from the root: hang it off the root
+            node = next(node for node in nodes if node not in position)
+            position[node] = index
+            order.append(node)
+            parents.append(0)
+            depths.append(1)
+        node = order[index]
+        for child in graph.successors(node):
+            if child not in position:
+                position[child] = len(order)
+                order.append(child)
+                parents.append(index)
+                depths.append(depths[index] + 1)
+    return order, np.asarray(parents, dtype=np.int64), np.asarray(depths, dtype=np.int64)
+
+def leaf_spans(parents, depths):
+    """Leaves under each node and the offset of its first leaf in depth-first order
+
+    parents and depths come from spanning_tree, so each depth is a contiguous
+    range with siblings next to each other; one vectorized pass per depth
+    sums the leaves bottom-up and another hands out offsets top-down.
+    """
+    count = len(parents)
+    has_children = np.zeros(count, dtype=bool)
+    has_children[parents[1:]] = True
+    leaves = (~has_children).astype(np.float64)
+    starts = np.zeros(count, dtype=np.float64)
+    if count <= 1:
+        return starts, leaves
+
+    levels = np.searchsorted(depths, np.arange(depths[-1] + 2))
+    for depth in range(depths[-1], 0, -1):
+        lo, hi = levels[depth], levels[depth + 1]
+        np.add.at(leaves, parents[lo:hi], leaves[lo:hi])
+
+    for depth in range(1, depths[-1] + 1):
+        lo, hi = levels[depth], levels[depth + 1]
+        level_parents = parents[lo:hi]
+        before = np.cumsum(leaves[lo:hi]) - leaves[lo:hi]
+        # Offset of each sibling group's first member within the level
+        first = np.flatnonzero(np.r_[True, level_parents[1:] != level_parents[:-1]])
+        group = np.repeat(first, np.diff(np.r_[first, hi - lo]))
+        starts[lo:hi] = starts[level_parents] + before - before[group]
+    return starts, leaves
+
+def normalize(coordinates):
+    "Center coordinates and scale them into [-1, 1], as networkx layouts do"
+    coordinates = coordinates - coordinates.mean(axis=0)
+    extent = np.abs(coordinates).max()
+    return coordinates / extent if extent > 0 else coordinates
+
+def as_positions(nodes, coordinates):
+    return dict(zip(nodes, coordinates))
+
+def radial_coordinates(parents, depths, dim):
+    starts, leaves = leaf_spans(parents, depths)
+    total = leaves[0] if len(leaves) else 1
+    # Each node sits in the middle of the angle its leaves span, at a
+    # radius given by its depth
+    angle = 2 * math.pi * (starts + leaves / 2) / total
+    radius = depths.astype(np.float64)
+    coordinates = [radius * np.cos(angle), radius * np.sin(angle)]
+    if dim == 3:
+        # A cone tree: each level one step further down the axis
+        coordinates.append(-radius)
+    return normalize(np.column_stack(coordinates))
+
+def radial_layout(graph, dim=2):
+    "Concentric rings by depth, with angles proportional to leaf counts; linear time"
+    nodes, parents, depths = spanning_tree(graph)
+    if not nodes:
+        return {}
+    return as_positions(nodes, radial_coordinates(parents, depths, dim))
+
+def tree_layout(graph, dim=2):
+    """Layered top-down tree, each parent centred over the leaves below it; linear time
+
+    This is Reingold-Tilford without subtree compaction: leaves take
+    consecutive columns in depth-first order. In 3D the tree lies in z = 0.
+    """
+    nodes, parents, depths = spanning_tree(graph)
+    if not nodes:
+        return {}
+    starts, leaves = leaf_spans(parents, depths)
+    coordinates = [2 * (starts + leaves / 2) / leaves[0] - 1,
+                   1 - 2 * depths / max(depths[-1], 1)]
+    if dim == 3:
+        coordinates.append(np.zeros(len(nodes)))
+    return as_positions(nodes, np.column_stack(coordinates))
+
+def force_layout(graph, dim=2, iterations=30, chunk=4096, seed=0):
+    """Fruchterman-Reingold forces with Barnes-Hut style cell approximation
+
+    Repulsion from all other nodes is replaced by repulsion from the centres
+    of mass of about sqrt(n) grid cells, which makes each iteration
+    O(n sqrt(n)) rather than O(n^2). Edges pull as usual. Starts from the
+    radial layout, so few iterations are needed.
+    """
+    nodes, parents, depths = spanning_tree(graph)
+    count = len(nodes)
+    if count <= 2:
+        return radial_layout(graph, dim)
+
+    rng = np.random.default_rng(seed)
+    positions = radial_coordinates(parents, depths, dim)
+    positions += rng.uniform(-1e-3, 1e-3, positions.shape)
+    k = 1 / math.sqrt(count)
+    temperature = 0.1
+    cooling = temperature / (iterations + 1)
+    children = np.arange(1, count)
+    edge_parents = parents[1:]
+    grid = max(1, int(round(count ** (0.5 / dim))))
+    shape = (grid,) * dim
+
+    for _ in range(iterations):
+        # Centres of mass of the occupied grid cells
+        low = positions.min(axis=0)
+        span = positions.max(axis=0) - low + 1e-12
+        cell_coordinates = np.minimum(((positions - low) / span * grid).astype(np.int64), grid - 1)
+        cells = np.ravel_multi_index(cell_coordinates.T, shape)
+        mass = np.bincount(cells, minlength=grid ** dim).astype(np.float64)
+        sums = np.column_stack([np.bincount(cells, positions[:, axis], grid ** dim) for axis in range(dim)])
+        occupied = np.flatnonzero(mass)
+        column = np.full(grid ** dim, -1)
+        column[occupied] = np.arange(len(occupied))
+        cell_mass = mass[occupied]
+        cell_centres = sums[occupied] / cell_mass[:, None]
+
+        # Sum of w * (x - c) over cells, written as matrix products:
+        # x * sum(w) - w @ c, with |x - c|^2 = |x|^2 + |c|^2 - 2 x.c
+        displacement = np.zeros_like(positions)
+        centre_norms = (cell_centres ** 2).sum(axis=1)
+        for lo in range(0, count, chunk):
+            hi = min(lo + chunk, count)
+            block = positions[lo:hi]
+            distance2 = (block ** 2).sum(axis=1)[:, None] + centre_norms[None, :] - 2 * block @ cell_centres.T
+            weight = k * k * cell_mass[None, :] / np.maximum(distance2, 1e-9)
+            # A node's own cell is handled below without the node itself
+            weight[np.arange(hi - lo), column[cells[lo:hi]]] = 0
+            displacement[lo:hi] = block * weight.sum(axis=1)[:, None] - weight @ cell_centres
+
+        own_mass = mass[cells] - 1
+        own_centre = (sums[cells] - positions) / np.maximum(own_mass, 1)[:, None]
+        delta = positions - own_centre
+        distance2 = np.maximum((delta ** 2).sum(axis=1), 1e-9)
+        displacement += delta * (k * k * own_mass / distance2)[:, None]
+
+        # Attraction along tree edges
+        delta = positions[children] - positions[edge_parents]
+        pull = delta * (np.sqrt((delta ** 2).sum(axis=1)) / k)[:, None]
+        displacement[children] -= pull
+        np.add.at(displacement, edge_parents, pull)
+
+        length = np.maximum(np.sqrt((displacement ** 2).sum(axis=1)), 1e-12)
+        positions += displacement * (np.minimum(length, temperature) / length)[:, None]
+        temperature -= cooling
+
+    return as_positions(nodes, normalize(positions))
+
+def spring_layout(graph, dim=2, pos=None):
+    "networkx's spring_layout, keeping any nodes that already have positions in place"
+    import networkx as nx
+
+    if pos is None:
+        return nx.spring_layout(graph, dim=dim)
+    kept = [node for node in pos if node in graph]
+    return nx.spring_layout(graph, dim=dim, pos=pos, fixed=kept or None)
+
+LAYOUTS = {
+    "spring": spring_layout,
+    "radial": radial_layout,
+    "tree": tree_layout,
+    "force": force_layout,
+}
+
+def choose_layout(graph):
+    "spring for small graphs, where it looks best, radial beyond that"
+    return "spring" if graph.number_of_nodes() <= SPRING_LIMIT else "radial"
+
+def seeded_layout(graph, fresh, pos):
+    """fresh, with the nodes of pos kept where they were
+
+    Every other node keeps its offset from its parent in fresh, so new
+    parts of the tree grow out of the old positions rather than the whole
+    tree moving. Applied level by level from the root, one vectorized
+    step per depth.
+    """
+    nodes, parents, depths = spanning_tree(graph)
+    if not nodes:
+        return {}
+    offsets = np.array([fresh[node] for node in nodes], dtype=np.float64)
+    coordinates = offsets.copy()
+    kept = np.zeros(len(nodes), dtype=bool)
+    for n, node in enumerate(nodes):
+        if node in pos:
+            coordinates[n] = pos[node]
+            kept[n] = True
+    offsets[1:] -= offsets[parents[1:]]
+    levels = np.searchsorted(depths, np.arange(depths[-1] + 2))
+    for depth in range(1, depths[-1] + 1):
+        placed = np.arange(levels[depth], levels[depth + 1])
+        placed = placed[~kept[placed]]
+        coordinates[placed] = coordinates[parents[placed]] + offsets[placed]
+    return as_positions(nodes, coordinates)
+
+def compute_layout(graph, name=None, dim=2, pos=None):
+    """Positions for every node of graph using the named layout (None to choose)
+
+    pos may hold positions for some nodes already, such as those a refresh
+    left alone; they are kept and the rest placed around them: by spring
+    itself, and for the other layouts by seeded_layout().
+    """
+    if name is None:
+        name = choose_layout(graph)
+    if pos is not None and len(pos) >= graph.number_of_nodes():
+        return pos
+    if name == "spring":
+        return spring_layout(graph, dim, pos)
+    fresh = LAYOUTS[name](graph, dim)
+    if pos:
+        return seeded_layout(graph, fresh, pos)
+    return fresh
@@ -1,98 +1,88 @@
 import os
 
-from git import Repo
 import gin
-import matplotlib.pyplot as plt
-import networkx as nx
-from treelib import Tree
+from core import NODE_BUDGET, build_compact_tree, build_graph, mark_status, tree_text
+from profiling import StageTimer
+from render import FORMATS, WEB_NODE_BUDGET, layout_graph, render_file, tree_figure
 
-class TreeNode:
-    def __init__(self, name, size=0):
-        self.name = name
-        self.size = size
-        self.children = {}
+def index_paths(path):
+    "(index file, work tree or None) for a repository's work tree or an index file"
+    if os.path.isdir(path):
+        return os.path.join(path, '.git', 'index'), path
+    return path, None
 
-    def add_child(self, child):
-        self.children[child.name] = child
+def main():
+    import argparse
 
-    def __str__(self):
-        tree = Tree()
-        self._build_tree(tree, self)
-        return tree.show(stdout=False)
+    parser = argparse.ArgumentParser(description="visualize the Git index of a repository")
+    parser.add_argument("path", nargs="?", default=".",
+        help="repository work tree, or an index file (default: the current directory)")
+    parser.add_argument("-o", "--output",
+        help="write the picture to this %s file instead of opening a window" % "/".join(
+            extension[1:].upper() for extension in FORMATS))
+    parser.add_argument("--3d", dest="is_3d", action="store_true",
+        help="draw the graph in 3D")
+    parser.add_argument("--status", action="store_true",
+        help="colour the files of a work tree that differ from its index (scans the work tree)")
+    parser.add_argument("-n", "--budget", type=int,
+        help="most nodes to draw before directories are collapsed (default: %d, or %d for HTML)" % (
+            NODE_BUDGET, WEB_NODE_BUDGET))
+    parser.add_argument("--profile", action="store_true",
+        help="print the time each stage of the pipeline takes, to stderr")
+    args = parser.parse_args()
 
-    def _build_tree(self, tree, node, parent=None):
-        node_id = node.name
-        node_tag = f"{node.name} ({node.size} bytes)" if node.size > 0 else node.name
-        tree.create_node(node_tag, node_id, parent=parent)
-        for child in node.children.values():
-            self._build_tree(tree, child, node_id)
+    budget = args.budget
+    if budget is None:
+        html = args.output is not None and args.output.lower().endswith(".html")
+        budget = WEB_NODE_BUDGET if html else NODE_BUDGET
 
-def build_tree_from_index(entries, repo_url=None):
-    if repo_url is None:
-        repo_name = "root"  
-    else:      
-        repo_name = repo_url.split('.git')[0].split('/')[-1]  # Get the current working directory's name
-    root = TreeNode(repo_name)
-    for entry in entries:
-        if "name" in entry:
-            parts = entry["name"].split('/')
-            current_node = root
-            for part in parts:
-                if part not in current_node.children:
-                    size = entry.get("size", 0) if part == parts[-1] else 0
-                    new_node = TreeNode(part, size)
-                    current_node.add_child(new_node)
-                current_node = current_node.children[part]
-    return root
+    index_file, worktree = index_paths(args.path)
+    if not os.path.isfile(index_file):
+        parser.error("no index file at %s" % index_file)
+    if args.status and worktree is None:
+        parser.error("--status needs a repository work tree, not an index file")
 
-def visualize_tree(node, graph, parent=None):
-    label = f"{node.name}\n({node.size} bytes)" if node.size > 0 else node.name
-    color = 'red' if node.size > 0 else 'green'  # Example color logic
-    graph.add_node(node.name, label=label, size=node.size, color=color, shape='o')
-    if parent:
-        graph.add_edge(parent, node.name, color='blue', style='solid')
-    for child in node.children.values():
-        visualize_tree(child, graph, node.name)
+    timer = StageTimer()
+    with timer.stage("parse"):
+        entries = gin.parse_columns(index_file)
+    with timer.stage("tree"):
+        tree = build_compact_tree(entries)
+    with timer.stage("text"):
+        # A figure can only show so much text
+        tree_str = tree_text(tree, max_depth=3, max_lines=200)
 
-def draw_tree(graph, ax, is_3d=False):
-    pos = nx.spring_layout(graph, dim=3) if is_3d else nx.spring_layout(graph)
-    
-    # Calculate node sizes based on the number of edges (references)
-    node_sizes = [100 * (graph.degree(node) + 1) for node in graph.nodes()]
-    
-    if is_3d:
-        for node, (x, y, z) in pos.items():
-            ax.scatter(x, y, z, s=node_sizes[list(graph.nodes()).index(node)])
-            ax.text(x + 0.1, y + 0.1, z + 0.1, f"{node}\n({graph.nodes[node]['size']} bytes)", size=10, zorder=1, color='k')
-        
-        for edge in graph.edges():
-            x = [pos[edge[0]][0], pos[edge[1]][0]]
-            y = [pos[edge[0]][1], pos[edge[1]][1]]
-            z = [pos[edge[0]][2], pos[edge[1]][2]]
-            ax.plot(x, y, z, color='b')
-    else:
-        nx.draw(graph, pos, ax=ax, with_labels=False, node_size=node_sizes, node_color='skyblue', font_size=10, font_weight='bold')
-        for node, (x, y) in pos.items():
-            ax.text(x + 0.02, y + 0.02, f"{node}\n({graph.nodes[node]['size']} bytes)", size=10, color='k')
-    
-    ax.grid(False)  # Disable the grid
-    ax.set_axis_off()  # Disable the axis
-    ax.set_facecolor('white')  # Set the background color to white
+    with timer.stage("graph"):
+        graph = build_graph(tree, budget)
+    if args.status:
+        import status
 
-def main():
-    index_file = '.git/index'
-    entries = list(gin.parse(index_file))
-    tree = build_tree_from_index(entries)
-    tree_str = str(tree)
+        with timer.stage("status"):
+            mark_status(graph, status.dirty_paths(entries, status.worktree_status(worktree, entries, index_file)))
+    with timer.stage("layout"):
+        pos = layout_graph(graph, args.is_3d)
+
+    if args.output:
+        try:
+            with timer.stage("draw"):
+                render_file(graph, args.output, tree_str, args.is_3d, pos)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.profile:
+            timer.report("main.py stages")
+        return
 
-    graph = nx.DiGraph()
-    visualize_tree(tree, graph)
+    # Only an on-screen window needs pyplot and a GUI backend
+    import matplotlib.pyplot as plt
 
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 8), gridspec_kw={'width_ratios': [3, 7]})
-    ax1.axis('off')
-    ax1.text(0, 1, tree_str, fontsize=12, va='top', ha='left', family='monospace')
-    draw_tree(graph, ax2)
+    with timer.stage("draw"):
+        fig = plt.figure(figsize=(15, 8))
+        tree_figure(fig, graph, tree_str, args.is_3d, pos)
+    if args.profile:
+        # plt.show() draws too, but only returns once the window is closed
+        with timer.stage("canvas"):
+            fig.canvas.draw()
+        timer.report("main.py stages")
     plt.show()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
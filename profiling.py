@@ -0,0 +1,64 @@
+"profiling - wall-clock time and peak memory of named pipeline stages"
+
+# Shared by bench.py and the --profile flags of main.py and gui.py, so
+# that all of them name and report the stages of parse -> tree -> graph ->
+# layout -> draw the same way.
+
+import collections
+import contextlib
+import sys
+import time
+import tracemalloc
+
+class StageTimer:
+    """Seconds, and with memory the peak traced bytes, of each stage run under stage()
+
+    Stages may repeat, such as a redraw; their times add up and the
+    largest peak is kept.
+    """
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.stages = collections.OrderedDict()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        started_tracing = False
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            record = self.stages.setdefault(name, collections.OrderedDict([("stage", name), ("seconds", 0.0)]))
+            record["seconds"] += elapsed
+            if self.memory:
+                # Memory allocated at the peak, beyond what was live before
+                peak = tracemalloc.get_traced_memory()[1] - base
+                record["peak_bytes"] = max(record.get("peak_bytes", 0), peak)
+                if started_tracing:
+                    tracemalloc.stop()
+
+    def results(self):
+        "The stages in the order they first ran, as dicts ready for JSON"
+        return [dict(record) for record in self.stages.values()]
+
+    def total(self):
+        return sum(record["seconds"] for record in self.stages.values())
+
+    def report(self, title="stages", file=None):
+        "Print a line per stage and the total, to stderr by default"
+        file = file or sys.stderr
+        print("%s:" % title, file=file)
+        for record in self.stages.values():
+            line = "  %-10s %9.3f s" % (record["stage"], record["seconds"])
+            if "peak_bytes" in record:
+                line += "  %8.1f MB peak" % (record["peak_bytes"] / (1024 * 1024))
+            print(line, file=file)
+        print("  %-10s %9.3f s" % ("total", self.total()), file=file)
+
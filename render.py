@@ -0,0 +1,175 @@
+"render - drawing the file tree graph, on screen or into PNG, SVG or HTML files"
+
+# Toolkits are imported where used: matplotlib for drawing on axes and
+# for PNG and SVG files, which go through matplotlib.figure.Figure so that
+# no GUI backend is started, and plotly for HTML. The HTML page draws with
+# WebGL, so it stays interactive for graphs far beyond what matplotlib
+# redraws on each zoom.
+
+import os
+import time
+
+import numpy as np
+
+import layout
+
+# Most text labels draw_tree puts on a graph
+LABEL_LIMIT = 50
+# Node colours by worktree status, as set by core.mark_status
+STATUS_COLORS = {"modified": "orange", "deleted": "red"}
+# Formats render_file writes, by file extension
+FORMATS = (".png", ".svg", ".html")
+# Node budget for graphs drawn as HTML, in place of core.NODE_BUDGET
+WEB_NODE_BUDGET = 100000
+
+def layout_graph(graph, is_3d=False, pos=None, algorithm=None):
+    # Positions may come precomputed, e.g. from the artifact cache; see
+    # layout.LAYOUTS for the algorithms, None picks one by graph size
+    return layout.compute_layout(graph, algorithm, dim=3 if is_3d else 2, pos=pos)
+
+def label_nodes(graph, nodes, limit=LABEL_LIMIT):
+    """The nodes worth a text label, at most limit of them
+
+    Directories come first, those with the most children leading, then
+    the largest files; drawing thousands of labels costs more than the
+    rest of the plot and leaves them unreadable anyway.
+    """
+    directories = [node for node in nodes if graph.out_degree(node)]
+    directories.sort(key=graph.out_degree, reverse=True)
+    chosen = directories[:limit]
+    if len(chosen) < limit:
+        files = [node for node in nodes if not graph.out_degree(node)]
+        files.sort(key=lambda node: graph.nodes[node]['size'], reverse=True)
+        chosen += files[:limit - len(chosen)]
+    return chosen
+
+def draw_tree(graph, ax, is_3d=False, pos=None, stats=None):
+    """Draw graph on ax with one scatter for the nodes and one collection for the edges
+
+    Only the nodes picked by label_nodes get labels. If stats is a dict it
+    receives the node, edge and label counts and the seconds taken.
+    """
+    from matplotlib.collections import LineCollection
+    from mpl_toolkits.mplot3d.art3d import Line3DCollection
+
+    start = time.perf_counter()
+    pos = layout_graph(graph, is_3d, pos)
+
+    nodes = list(graph.nodes())
+    index = {node: n for n, node in enumerate(nodes)}
+    coordinates = np.array([pos[node] for node in nodes], dtype=float).reshape(len(nodes), 3 if is_3d else 2)
+    # Node sizes based on the number of edges (references)
+    node_sizes = 100 * (np.fromiter((degree for _, degree in graph.degree(nodes)), dtype=float, count=len(nodes)) + 1)
+    edges = np.array([(index[u], index[v]) for u, v in graph.edges()], dtype=np.int64).reshape(-1, 2)
+    segments = coordinates[edges]
+
+    default_color = 'C0' if is_3d else 'skyblue'
+    colors = [STATUS_COLORS.get(graph.nodes[node].get('status'), default_color) for node in nodes]
+    if is_3d:
+        ax.add_collection3d(Line3DCollection(segments, colors='b', linewidths=0.5))
+        # Pickable, so that clicking a collapsed node can expand it
+        ax.scatter(coordinates[:, 0], coordinates[:, 1], coordinates[:, 2], s=node_sizes, c=colors,
+                   depthshade=False, picker=True)
+    else:
+        ax.add_collection(LineCollection(segments, colors='k', linewidths=0.5))
+        ax.scatter(coordinates[:, 0], coordinates[:, 1], s=node_sizes, c=colors, zorder=2, picker=True)
+
+    labelled = label_nodes(graph, nodes)
+    offset = 0.1 if is_3d else 0.02
+    for node in labelled:
+        xyz = coordinates[index[node]] + offset
+        ax.text(*xyz, graph.nodes[node].get('label', node), size=10, zorder=1, color='k')
+
+    ax.grid(False)  # Disable the grid
+    ax.set_axis_off()  # Disable the axis
+    ax.set_facecolor('white')  # Set the background color to white
+    if stats is not None:
+        stats.update(nodes=len(nodes), edges=len(edges), labels=len(labelled),
+                     seconds=time.perf_counter() - start)
+    return pos
+
+def tree_figure(figure, graph, text, is_3d=False, pos=None, stats=None):
+    """Fill figure with the text tree on the left and the drawn graph on the right
+
+    Returns the positions used, as draw_tree does.
+    """
+    grid = figure.add_gridspec(1, 2, width_ratios=[3, 7])
+    text_ax = figure.add_subplot(grid[0])
+    text_ax.axis('off')
+    text_ax.text(0, 1, text, fontsize=12, va='top', ha='left', family='monospace')
+    ax = figure.add_subplot(grid[1], projection='3d' if is_3d else None)
+    return draw_tree(graph, ax, is_3d, pos, stats)
+
+def render_html(graph, filename, is_3d=False, pos=None, title=None, offline=True):
+    """Write graph as an interactive plotly page; hovering a node shows its label
+
+    Nodes are one WebGL trace (Scattergl, or Scatter3d in 3D) and edges
+    another, so the page stays responsive with a hundred thousand nodes.
+    The page embeds plotly.js and opens without a network connection,
+    unless offline is False, when it loads plotly.js from its CDN instead.
+    """
+    import plotly.graph_objects as go
+
+    pos = layout_graph(graph, is_3d, pos)
+    nodes = list(graph.nodes())
+    index = {node: n for n, node in enumerate(nodes)}
+    coordinates = np.array([pos[node] for node in nodes], dtype=float).reshape(len(nodes), 3 if is_3d else 2)
+    edges = np.array([(index[u], index[v]) for u, v in graph.edges()], dtype=np.int64).reshape(-1, 2)
+    # All edges in one trace, each segment ended by a NaN gap, which plotly
+    # treats as None while keeping the arrays binary-encoded
+    segments = np.full((len(edges), 3, coordinates.shape[1]), np.nan)
+    segments[:, 0] = coordinates[edges[:, 0]]
+    segments[:, 1] = coordinates[edges[:, 1]]
+    segments = segments.reshape(-1, coordinates.shape[1])
+    attributes = graph.nodes
+    labels = [attributes[node].get('label', node).replace("\n", "<br>") for node in nodes]
+    # Colours as codes into a discrete colour scale: plotly checks a list
+    # of colour names one by one, which takes seconds for large graphs
+    palette = ['steelblue'] + list(STATUS_COLORS.values())
+    codes = {status: n for n, status in enumerate(STATUS_COLORS, 1)}
+    colors = np.fromiter((codes.get(attributes[node].get('status'), 0) for node in nodes),
+                         dtype=np.uint8, count=len(nodes))
+    colorscale = [(bound, color) for n, color in enumerate(palette)
+                  for bound in (n / len(palette), (n + 1) / len(palette))]
+    # Sized by degree as draw_tree does, on plotly's scale of pixels
+    degrees = np.fromiter((degree for _, degree in graph.degree(nodes)), dtype=float, count=len(nodes))
+    node_sizes = np.clip(3 + 2 * np.sqrt(degrees), 3, 30)
+
+    marker_colors = dict(color=colors, colorscale=colorscale, cmin=-0.5, cmax=len(palette) - 0.5)
+    if is_3d:
+        edge_trace = go.Scatter3d(x=segments[:, 0], y=segments[:, 1], z=segments[:, 2], mode='lines',
+                                  line=dict(color='blue', width=1), hoverinfo='none')
+        node_trace = go.Scatter3d(x=coordinates[:, 0], y=coordinates[:, 1], z=coordinates[:, 2], mode='markers',
+                                  marker=dict(size=node_sizes, line=dict(width=0), **marker_colors),
+                                  text=labels, hoverinfo='text')
+    else:
+        edge_trace = go.Scattergl(x=segments[:, 0], y=segments[:, 1], mode='lines',
+                                  line=dict(color='black', width=0.5), hoverinfo='none')
+        node_trace = go.Scattergl(x=coordinates[:, 0], y=coordinates[:, 1], mode='markers',
+                                  marker=dict(size=node_sizes, **marker_colors), text=labels, hoverinfo='text')
+    figure = go.Figure([edge_trace, node_trace])
+    hidden = dict(visible=False)
+    figure.update_layout(title=title, showlegend=False, plot_bgcolor='white', hovermode='closest',
+                         xaxis=hidden, yaxis=hidden,
+                         scene=dict(xaxis=hidden, yaxis=hidden, zaxis=hidden))
+    figure.write_html(filename, include_plotlyjs=True if offline else 'cdn',
+                      config=dict(scrollZoom=True, displaylogo=False))
+    return pos
+
+def render_file(graph, filename, text="", is_3d=False, pos=None, stats=None):
+    """Write graph to filename as PNG, SVG or HTML, chosen by its extension
+
+    PNG and SVG show the text tree beside the graph as the window does;
+    HTML shows the graph alone. Nothing here needs a display.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError("cannot render to %s files, only to %s" % (extension or filename, ", ".join(FORMATS)))
+    if extension == ".html":
+        return render_html(graph, filename, is_3d, pos, title=text.split("\n", 1)[0] or None)
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=(15, 8))
+    pos = tree_figure(figure, graph, text, is_3d, pos, stats)
+    figure.savefig(filename)
+    return pos
@@ -0,0 +1,411 @@
+"search - find index entries by path and by their stat and flag columns"
+
+# Works on gin.IndexColumns. Git keeps index entries sorted by the bytes of
+# their paths, so the entries themselves are the sorted path array that
+# prefix lookups binary-search; substring and glob queries go through a
+# trigram index over the names, built on first use, and whatever it cannot
+# settle is compared a word at a time across the name bytes with numpy.
+
+import bisect
+import fnmatch
+import itertools
+import re
+
+import numpy as np
+
+import gin
+
+# File types by the names accepted for the mode filter
+MODES = {
+    "file": 0o100644,
+    "executable": 0o100755,
+    "symlink": 0o120000,
+    "gitlink": 0o160000,
+}
+
+# Entries whose trigrams are extracted, or whose names are compared
+# against a pattern, at a time
+TRIGRAM_CHUNK = 1 << 16
+# Places in a path from here on share one value in the trigram index
+FAR_PLACE = 0xFF
+# Stands for any one byte in the pieces of wildcard_pieces()
+ANY_BYTE = -1
+
+def parse_mode(mode):
+    "A mode given as an int, an octal string such as \"100755\" or a MODES name"
+    if isinstance(mode, str):
+        if mode in MODES:
+            return MODES[mode]
+        try:
+            return int(mode, 8)
+        except ValueError:
+            raise ValueError("invalid mode %r: expected an octal number or one of %s"
+                             % (mode, ", ".join(MODES))) from None
+    return mode
+
+def is_glob(query):
+    return any(character in query for character in "*?[")
+
+def wildcard_pieces(pattern):
+    """A glob pattern split at its stars, and whether that is all of it
+
+    Each piece is a tuple of path bytes, with ANY_BYTE for a ? and for a
+    [...] class, read as fnmatch reads them. The pieces match whatever
+    the pattern matches; with classes, a superset of it.
+    """
+    pieces = [[]]
+    exact = True
+    n = 0
+    while n < len(pattern):
+        character = pattern[n]
+        n += 1
+        if character == "*":
+            pieces.append([])
+        elif character == "?":
+            pieces[-1].append(ANY_BYTE)
+        elif character == "[":
+            end = n + (pattern[n:n + 1] == "!")
+            end += pattern[end:end + 1] == "]"
+            end = pattern.find("]", end)
+            if end < 0:
+                # An unclosed [ is a plain character
+                pieces[-1].append(ord("["))
+            else:
+                pieces[-1].append(ANY_BYTE)
+                exact = False
+                n = end + 1
+        else:
+            pieces[-1].extend(character.encode("utf-8"))
+    return [tuple(piece) for piece in pieces], exact
+
+def literal_parts(pieces):
+    "The runs of plain bytes in wildcard_pieces(), which any match must contain"
+    return [bytes(run) for piece in pieces
+            for plain, run in itertools.groupby(piece, lambda byte: byte != ANY_BYTE) if plain]
+
+class IndexSearch:
+    "Prefix, substring, glob and column filter queries over a gin.IndexColumns"
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.offsets = columns.column("name_offsets").astype(np.int64)
+        self.data = np.frombuffer(columns.name_data, dtype=np.uint8)
+        # Unique trigram codes, where each one's entries start in
+        # trigram_entries, and the entries containing each trigram in order
+        self.trigram_codes = None
+        self.trigram_starts = None
+        self.trigram_entries = None
+        # Where in its path each trigram of trigram_entries first starts,
+        # or FAR_PLACE if not before that
+        self.trigram_places = None
+        # Entries of the paths too short to have a trigram
+        self.short_entries = None
+
+    def __len__(self):
+        return len(self.columns)
+
+    def prefix(self, prefix):
+        "Entry numbers of the paths starting with prefix, by binary search"
+        if isinstance(prefix, str):
+            prefix = prefix.encode("utf-8")
+        name_bytes = self.columns.name_bytes
+        entries = range(len(self.columns))
+        lo = bisect.bisect_left(entries, prefix, key=name_bytes)
+        # Every path with the prefix sorts before the prefix with its last
+        # byte incremented; trailing 0xFF bytes cannot be incremented
+        upper = prefix.rstrip(b"\xff")
+        if not upper:
+            return np.arange(lo, len(entries))
+        upper = upper[:-1] + bytes([upper[-1] + 1])
+        hi = bisect.bisect_left(entries, upper, lo, key=name_bytes)
+        return np.arange(lo, hi)
+
+    def build_trigrams(self):
+        "Index the trigrams of every path; done once, on the first query needing it"
+        data = self.data
+        lengths = np.diff(self.offsets)
+        chunks = []
+        for lo in range(0, len(self.columns), TRIGRAM_CHUNK):
+            hi = min(lo + TRIGRAM_CHUNK, len(self.columns))
+            counts = np.maximum(lengths[lo:hi] - 2, 0)
+            total = int(counts.sum())
+            if not total:
+                continue
+            # Place of every trigram of these names within its name, and
+            # its position in name_data
+            places = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            positions = places + np.repeat(self.offsets[lo:hi], counts)
+            codes = (data[positions].astype(np.uint64) << 16 | data[positions + 1].astype(np.uint64) << 8
+                | data[positions + 2])
+            entries = np.repeat(np.arange(lo, hi, dtype=np.uint64), counts)
+            chunks.append(codes << 40 | entries << 8 | np.minimum(places, FAR_PLACE).astype(np.uint64))
+        keys = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.uint64)
+        del chunks
+        self.short_entries = np.flatnonzero(lengths < 3)
+        # Sorted by trigram, entry and place; a trigram repeated within a
+        # path leaves adjacent keys, the first at its first place
+        keys.sort()
+        if len(keys):
+            keys = keys[np.r_[True, keys[1:] >> 8 != keys[:-1] >> 8]]
+        codes = (keys >> 40).astype(np.uint32)
+        self.trigram_entries = (keys >> 8 & 0xFFFFFFFF).astype(np.uint32)
+        self.trigram_places = (keys & 0xFF).astype(np.uint8)
+        del keys
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else np.zeros(0, dtype=np.int64)
+        self.trigram_codes = codes[starts]
+        self.trigram_starts = np.append(starts, len(codes))
+
+    def trigram_candidates(self, literals):
+        """Entry numbers of the paths containing every trigram of the literals
+
+        None when no literal is long enough to have a trigram. Also returns
+        the rarest of those trigrams and where it first starts in each of
+        the paths, as in trigram_places.
+        """
+        codes = set()
+        for literal in literals:
+            for n in range(len(literal) - 2):
+                codes.add(literal[n] << 16 | literal[n + 1] << 8 | literal[n + 2])
+        if not codes:
+            return None, None, None
+        if self.trigram_codes is None:
+            self.build_trigrams()
+        postings = []
+        for code in codes:
+            n = np.searchsorted(self.trigram_codes, code)
+            if n == len(self.trigram_codes) or self.trigram_codes[n] != code:
+                return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint8), code
+            lo, hi = self.trigram_starts[n], self.trigram_starts[n + 1]
+            postings.append((self.trigram_entries[lo:hi], self.trigram_places[lo:hi], code))
+        # Start from the rarest trigram and binary-search the others for its
+        # entries, so the cost follows the shortest list, not the longest
+        postings.sort(key=lambda posting: len(posting[0]))
+        candidates, places, rarest = postings[0]
+        for posting, _, _ in postings[1:]:
+            # A trigram of every path rules nothing out, nor do the longer
+            # ones after it
+            if len(posting) == len(self.columns) or not len(candidates):
+                break
+            found = np.searchsorted(posting, candidates)
+            found[found == len(posting)] = 0
+            keep = posting[found] == candidates
+            candidates, places = candidates[keep], places[keep]
+        return candidates.astype(np.int64), places, rarest
+
+    def short_substring(self, text):
+        """Entry numbers of the paths containing text of one or two bytes
+
+        Wherever text is in a path of three bytes or more, one of the
+        path's trigrams holds it, so the entries of the trigrams holding
+        text are the answer; shorter paths are compared directly.
+        """
+        if self.trigram_codes is None:
+            self.build_trigrams()
+        codes = self.trigram_codes
+        value = int.from_bytes(text, "big")
+        bits = 8 * len(text)
+        holding = np.zeros(len(codes), dtype=bool)
+        for shift in range(0, 25 - bits, 8):
+            holding |= (codes >> shift & (1 << bits) - 1) == value
+        found = np.zeros(len(self.columns), dtype=bool)
+        for n in np.flatnonzero(holding):
+            lo, hi = self.trigram_starts[n], self.trigram_starts[n + 1]
+            if hi - lo == len(self.columns):
+                return np.arange(len(self.columns))
+            found[self.trigram_entries[lo:hi]] = True
+        found[self.matching(self.short_entries, [(), tuple(text), ()])] = True
+        return np.flatnonzero(found)
+
+    def words(self, width):
+        "name_data read as a little-endian word of width bytes starting at each byte"
+        return np.ndarray((max(len(self.data) - width + 1, 0),), dtype="<u%d" % width,
+                          buffer=self.data, strides=(1,))
+
+    def comparisons(self, piece):
+        """(offset, words, mask, value) for each word of piece to compare
+
+        Words are of up to 8 bytes, ANY_BYTE masked out of them; mask is
+        None when nothing is.
+        """
+        n = 0
+        while n < len(piece):
+            width = next(width for width in (8, 4, 2, 1) if width <= len(piece) - n)
+            chunk = piece[n:n + width]
+            mask = int.from_bytes(bytes(0 if byte == ANY_BYTE else 0xFF for byte in chunk), "little")
+            if mask:
+                value = int.from_bytes(bytes(0 if byte == ANY_BYTE else byte for byte in chunk), "little")
+                yield n, self.words(width), mask if mask != (1 << 8 * width) - 1 else None, value
+            n += width
+
+    def holds(self, positions, piece):
+        "Whether name_data holds piece at each of positions, which leave room for it"
+        found = np.ones(len(positions), dtype=bool)
+        for n, words, mask, value in self.comparisons(piece):
+            found &= (words[positions + n] if mask is None else words[positions + n] & mask) == value
+        return found
+
+    def occurs(self, positions, piece):
+        "Those of the positions, which leave room for piece, where name_data holds it"
+        for n, words, mask, value in self.comparisons(piece):
+            positions = positions[(words[positions + n] if mask is None else words[positions + n] & mask) == value]
+        return positions
+
+    def match_pieces(self, entries, pieces):
+        """The entries whose names match pieces as joined by stars
+
+        The first and last pieces are compared at the ends of each name and
+        every other piece at its leftmost place after the one before, all
+        with array comparisons over name_data.
+        """
+        starts = self.offsets[entries]
+        ends = self.offsets[entries + 1]
+        first, last = pieces[0], pieces[-1]
+        if len(pieces) == 1:
+            keep = ends - starts == len(first)
+            return entries[keep & self.holds(np.where(keep, starts, 0), first)]
+        keep = ends - starts >= len(first) + len(last)
+        # Names too short for the pieces are compared at 0 and dropped
+        if first:
+            keep &= self.holds(np.where(keep, starts, 0), first)
+        if last:
+            keep &= self.holds(np.where(keep, ends - len(last), 0), last)
+        entries, cursors, ends = entries[keep], starts[keep] + len(first), ends[keep] - len(last)
+        for piece in pieces[1:-1]:
+            if not piece:
+                continue
+            # Every place piece could start, in order within each name and
+            # the names in order, so a place is in the last name whose
+            # cursor is at or before it
+            counts = np.maximum(ends - cursors - len(piece) + 1, 0)
+            positions = np.arange(counts.sum()) + np.repeat(cursors - (np.cumsum(counts) - counts), counts)
+            positions = self.occurs(positions, piece)
+            owners = np.searchsorted(cursors, positions, "right") - 1
+            leftmost = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]]) if len(owners) else owners
+            owners = owners[leftmost]
+            entries, ends, cursors = entries[owners], ends[owners], positions[leftmost] + len(piece)
+        return entries
+
+    def matching(self, candidates, pieces):
+        "The candidates (all entries if None) whose names match pieces, a chunk at a time"
+        if candidates is None:
+            candidates = np.arange(len(self.columns))
+        found = [self.match_pieces(candidates[lo:lo + TRIGRAM_CHUNK], pieces)
+                 for lo in range(0, len(candidates), TRIGRAM_CHUNK)]
+        return np.concatenate(found) if found else np.zeros(0, dtype=np.int64)
+
+    def substring(self, text):
+        "Entry numbers of the paths containing text"
+        if isinstance(text, str):
+            text = text.encode("utf-8")
+        if len(text) < 3:
+            return self.short_substring(text)
+        candidates, places, rarest = self.trigram_candidates([text])
+        if len(text) == 3:
+            # Containing the one trigram is containing the text
+            return candidates
+        # A path mostly holds its rarest trigram once, so text is there
+        # where that trigram first starts; only the paths where it is not
+        # are searched through
+        starts = places.astype(np.int64) - text.index(rarest.to_bytes(3, "big"))
+        positions = self.offsets[candidates] + starts
+        fits = (places < FAR_PLACE) & (starts >= 0) & (positions + len(text) <= self.offsets[candidates + 1])
+        found = np.zeros(len(candidates), dtype=bool)
+        found[fits] = self.holds(positions[fits], tuple(text))
+        rest = ~found
+        if rest.any():
+            found[rest] = np.isin(candidates[rest], self.matching(candidates[rest], [(), tuple(text), ()]),
+                                  assume_unique=True)
+        return candidates[found]
+
+    def glob(self, pattern):
+        "Entry numbers of the paths matching the shell-style pattern; * also matches /"
+        pieces, exact = wildcard_pieces(pattern)
+        literals = literal_parts(pieces)
+        if len(pieces) > 1 and not any(pieces):
+            # Stars alone match every path
+            return np.arange(len(self.columns))
+        lead = bytes(itertools.takewhile(lambda byte: byte != ANY_BYTE, pieces[0]))
+        if lead:
+            # Checked by the binary search below
+            literals = literals[1:]
+        candidates = self.trigram_candidates(literals)[0]
+        if lead:
+            # Paths starting with the same bytes are one run of the entries
+            within = self.prefix(lead)
+            if candidates is None or not len(within):
+                candidates = within
+            else:
+                candidates = candidates[(candidates >= within[0]) & (candidates <= within[-1])]
+        found = self.matching(candidates, pieces)
+        if not exact:
+            # A [...] class was compared as any byte; check the few left
+            regex = re.compile(fnmatch.translate(pattern).encode("utf-8"), re.DOTALL)
+            name_bytes = self.columns.name_bytes
+            found = found[np.fromiter((regex.match(name_bytes(int(n))) is not None for n in found),
+                                      dtype=bool, count=len(found))]
+        return found
+
+    def mask(self, mode=None, size=None, mtime=None, stage=None, skip_worktree=None, intent_to_add=None):
+        """Boolean array over all entries of those passing the given filters
+
+        size and mtime are (low, high) ranges, inclusive, either end None
+        for no limit; mtime is in seconds. mode is anything parse_mode()
+        takes, stage 0 to 3, and the flags True or False.
+        """
+        mask = np.ones(len(self.columns), dtype=bool)
+        if mode is not None:
+            mask &= self.columns.column("mode") == parse_mode(mode)
+        for name, bounds in (("size", size), ("mtime_seconds", mtime)):
+            if bounds is None:
+                continue
+            low, high = bounds
+            values = self.columns.column(name)
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+        if stage is not None:
+            mask &= (self.columns.column("flags") & gin.STAGE_MASK) >> gin.STAGE_SHIFT == stage
+        extra_flags = self.columns.column("extra_flags")
+        for bit, wanted in ((gin.SKIP_WORKTREE, skip_worktree), (gin.INTENT_TO_ADD, intent_to_add)):
+            if wanted is not None:
+                mask &= (extra_flags & bit != 0) == wanted
+        return mask
+
+    def search(self, query=None, prefix=None, **filters):
+        """Sorted entry numbers matching all that is given
+
+        query is a glob pattern if it has any of *?[ and a substring
+        otherwise; filters are those of mask().
+        """
+        found = None
+        if prefix:
+            found = self.prefix(prefix)
+        if query:
+            matches = self.glob(query) if is_glob(query) else self.substring(query)
+            found = matches if found is None else np.intersect1d(found, matches, assume_unique=True)
+        if any(value is not None for value in filters.values()):
+            mask = self.mask(**filters)
+            found = np.flatnonzero(mask) if found is None else found[mask[found]]
+        if found is None:
+            found = np.arange(len(self.columns))
+        return found
+
+def parse_range(text):
+    "(low, high) from \"LOW:HIGH\", either side may be left out"
+    low, _, high = text.partition(":")
+    try:
+        return (float(low) if low else None, float(high) if high else None)
+    except ValueError:
+        raise ValueError("invalid range %r: expected LOW:HIGH numbers" % text) from None
+
+def search_file(filename, query=None, prefix=None, pretty=True, **filters):
+    "Print the paths, or with pretty False the entries as JSON, matching in an index file"
+    import json
+
+    columns = gin.parse_columns(filename)
+    for n in IndexSearch(columns).search(query, prefix, **filters):
+        if pretty:
+            print(columns.name(int(n)))
+        else:
+            print(json.dumps(columns.entry(int(n), pretty=False)))
@@ -0,0 +1,186 @@
+"status - compare a worktree with the stat data in its index"
+
+# The same check git status does for tracked files: an entry whose cached
+# stat data still matches the file is clean without reading it. Content
+# is only hashed where stat data cannot tell, that is for racily clean
+# entries (written in the same second the index was) and for files whose
+# stat data changed while their size did not.
+
+import concurrent.futures
+import hashlib
+import operator
+import os
+import stat
+import sys
+
+import numpy as np
+
+import gin
+
+CLEAN, MODIFIED, DELETED = 0, 1, 2
+STATUS_NAMES = ("clean", "modified", "deleted")
+
+# Index stat fields are 32 bits wide, larger values are truncated
+MASK = 0xFFFFFFFF
+
+# Paths each thread stats at a time
+STAT_CHUNK = 1024
+
+def git_mode(st):
+    "The mode git would record for a file with this lstat result, or 0 for other file types"
+    if stat.S_ISLNK(st.st_mode):
+        return 0o120000
+    if stat.S_ISDIR(st.st_mode):
+        return 0o160000
+    if stat.S_ISREG(st.st_mode):
+        return 0o100755 if st.st_mode & 0o100 else 0o100644
+    return 0
+
+def blob_sha1(path, st):
+    "The object id git would give the contents of path"
+    if stat.S_ISLNK(st.st_mode):
+        data = os.fsencode(os.readlink(path))
+        return hashlib.sha1(b"blob %d\x00" % len(data) + data).digest()
+    sha1 = hashlib.sha1(b"blob %d\x00" % st.st_size)
+    with open(path, "rb") as o:
+        for chunk in iter(lambda: o.read(1 << 20), b""):
+            sha1.update(chunk)
+    return sha1.digest()
+
+def stat_matches(columns, n, st):
+    "Whether entry n's cached stat data matches st"
+    return (columns.mtime_seconds[n] == (st.st_mtime_ns // 1000000000) & MASK and
+        columns.mtime_nanoseconds[n] == st.st_mtime_ns % 1000000000 and
+        columns.ctime_seconds[n] == (st.st_ctime_ns // 1000000000) & MASK and
+        columns.ctime_nanoseconds[n] == st.st_ctime_ns % 1000000000 and
+        columns.ino[n] == st.st_ino & MASK and
+        columns.uid[n] == st.st_uid & MASK and
+        columns.gid[n] == st.st_gid & MASK and
+        columns.size[n] == st.st_size & MASK)
+
+def entry_status(columns, n, path, st, racy_after):
+    "CLEAN or MODIFIED for entry n, whose file exists with lstat result st"
+    mode = columns.mode[n]
+    if mode == 0o160000:
+        # A submodule's state is its own repository's business
+        return CLEAN
+    if git_mode(st) != mode:
+        return MODIFIED
+    if stat_matches(columns, n, st):
+        # Racily clean: the file may have changed within the timestamp's
+        # granularity after the index recorded it
+        if (columns.mtime_seconds[n], columns.mtime_nanoseconds[n]) < racy_after:
+            return CLEAN
+    elif columns.size[n] != st.st_size & MASK:
+        return MODIFIED
+    return CLEAN if blob_sha1(path, st) == bytes(columns.sha1[20 * n:20 * n + 20]) else MODIFIED
+
+def lstat_paths(paths):
+    "lstat results for paths, None for those that do not exist"
+    results = []
+    append = results.append
+    for path in paths:
+        try:
+            append(os.lstat(path))
+        except (FileNotFoundError, NotADirectoryError):
+            append(None)
+    return results
+
+def unchanged(columns, entries, stats, racy_after):
+    """Boolean array of which entries have mode and stat data matching stats, and are not racy
+
+    The vectorized form of entry_status's first checks, so that only the
+    rest go through it one by one.
+    """
+    def field(getter, dtype=np.int64):
+        return np.fromiter(map(getter, stats), dtype=dtype, count=len(stats))
+
+    mtime = field(operator.attrgetter("st_mtime_ns"), np.uint64)
+    ctime = field(operator.attrgetter("st_ctime_ns"), np.uint64)
+    st_mode = field(operator.attrgetter("st_mode"))
+    regular = st_mode & 0o170000 == 0o100000
+    mode = np.where(regular, np.where(st_mode & 0o100, 0o100755, 0o100644), st_mode & 0o170000)
+    matches = regular | (mode == 0o120000)
+    matches &= columns.column("mode")[entries] == mode
+    for name, values in (
+            ("mtime_seconds", mtime // 1000000000),
+            ("mtime_nanoseconds", mtime % 1000000000),
+            ("ctime_seconds", ctime // 1000000000),
+            ("ctime_nanoseconds", ctime % 1000000000),
+            ("ino", field(operator.attrgetter("st_ino"), np.uint64)),
+            ("uid", field(operator.attrgetter("st_uid"))),
+            ("gid", field(operator.attrgetter("st_gid"))),
+            ("size", field(operator.attrgetter("st_size")))):
+        matches &= columns.column(name)[entries] == (values & MASK)
+    seconds, nanoseconds = racy_after
+    cached_seconds = columns.column("mtime_seconds")[entries]
+    matches &= (cached_seconds < seconds) | (
+        (cached_seconds == seconds) & (columns.column("mtime_nanoseconds")[entries] < nanoseconds))
+    return matches
+
+def worktree_status(root, columns=None, index_file=None, jobs=None):
+    """A bytearray holding CLEAN, MODIFIED or DELETED for every index entry of root
+
+    columns are parsed from index_file, by default root's .git/index, if
+    not given. Files are stat'ed in chunks on jobs threads (default: a
+    few per CPU), as lstat releases the GIL and mostly waits on the file
+    system; the results are then compared with the index in bulk.
+    """
+    if index_file is None:
+        index_file = os.path.join(root, ".git", "index")
+    if columns is None:
+        columns = gin.parse_columns(index_file)
+    # Entries last modified at or after the index was written are racy
+    index_mtime = os.stat(index_file).st_mtime_ns
+    racy_after = (index_mtime // 1000000000, index_mtime % 1000000000)
+
+    statuses = bytearray(len(columns))
+    extra_flags = columns.extra_flags
+    flags = columns.flags
+    entries = []
+    for n in range(len(columns)):
+        if extra_flags[n] & gin.SKIP_WORKTREE:
+            continue
+        if extra_flags[n] & gin.INTENT_TO_ADD or flags[n] & gin.STAGE_MASK:
+            # Not yet added, or unmerged: not the same as anything on disk
+            statuses[n] = MODIFIED
+            continue
+        entries.append(n)
+    if not entries:
+        return statuses
+
+    # Decoded as os.fsdecode() would, so that names which are not UTF-8
+    # still name their files; columns.name() is only for display
+    prefix = os.path.join(root, "")
+    data = columns.name_data
+    offsets = columns.name_offsets
+    encoding = sys.getfilesystemencoding()
+    errors = sys.getfilesystemencodeerrors()
+    paths = [prefix + data[offsets[n]:offsets[n + 1]].decode(encoding, errors) for n in entries]
+    if jobs is None:
+        jobs = min(32, (os.cpu_count() or 1) * 4)
+    if jobs <= 1:
+        stats = lstat_paths(paths)
+    else:
+        chunks = [paths[lo:lo + STAT_CHUNK] for lo in range(0, len(paths), STAT_CHUNK)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            stats = [st for results in executor.map(lstat_paths, chunks) for st in results]
+
+    present = [k for k, st in enumerate(stats) if st is not None]
+    if len(present) < len(entries):
+        for k, st in enumerate(stats):
+            if st is None:
+                statuses[entries[k]] = DELETED
+        entries = [entries[k] for k in present]
+        paths = [paths[k] for k in present]
+        stats = [stats[k] for k in present]
+        if not entries:
+            return statuses
+    entries = np.asarray(entries, dtype=np.int64)
+    for k in np.flatnonzero(~unchanged(columns, entries, stats, racy_after)):
+        statuses[entries[k]] = entry_status(columns, int(entries[k]), paths[k], stats[k], racy_after)
+    return statuses
+
+def dirty_paths(columns, statuses):
+    "{path: status name} of the entries that are not clean"
+    return {columns.name(n): STATUS_NAMES[status] for n, status in enumerate(statuses) if status != CLEAN}